@@ -1,28 +1,22 @@
 #!/usr/bin/env python3
 
 import argparse
-import csv
 import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib import transforms
 from matplotlib.animation import FuncAnimation
 import matplotlib.ticker as ticker
 
+import profiling
+import raster
+import cube
+import tween
 
-start_year = 1960
-stop_year = 2018
 
-
-# return {country: {year: population}} + {country: {short name}}
-def parse_file(filename: str, data_type='int') -> (dict, dict):
-    countries = {}
-    shorts = {}
-    with open(filename) as csvfile:
-        spamreader = csv.reader(csvfile, delimiter=';')
-        for row in spamreader:
-            countries[row[0]] = {start_year + i - 2: int(row[i]) if data_type == 'int' else float(row[i]) for i in range(2, len(row)) if row[i]}
-            shorts[row[0]] = row[1]
-    return countries, shorts
+# return {country: {time: value}} + {country: {short name}}, time axis is read from file header
+def parse_file(filename: str) -> (dict, dict):
+    indicators = cube.Cube.load({'value': filename})
+    return indicators.to_dict('value'), indicators.shorts()
 
 
 def pick_5_closest(country: str, data: dict, year: int):
@@ -51,80 +45,168 @@ def pick_5_closest(country: str, data: dict, year: int):
     return list(closest_5_sorted.keys())
 
 
-def main():
+# {country: {year: value}} as countries x years matrix, nan where there is no data
+def to_matrix(data: dict, countries: list, years: np.ndarray) -> np.ndarray:
+    return np.array([[data[country].get(year, np.nan) for year in years] for country in countries], dtype=float)
+
+
+# bars and labels are created once and only moved in every frame, title and x axis do not change,
+# so frame can be drawn over cached background (returned artists are the ones changed)
+def barh(ax, times: np.ndarray, frame_pop: np.ndarray, frame_pos: np.ndarray, names: list, shorts: list,
+         max_x: float, formatter, label, args) -> (callable, np.ndarray):
+    plt.xlabel('Population')
+    ax.set_xlim(0, max_x)
+    ax.set_ylim(-0.6, len(names) - 0.4)
+    ax.xaxis.set_major_formatter(formatter)
+    ax.tick_params(axis='x', which='minor', direction='out', bottom=True, length=5)
+    year_text = ax.text(0.75, 0.82, '', transform=ax.transAxes, size=44)
+    if args.color == 'color':
+        bars = ax.barh(frame_pos[:, 0], frame_pop[:, 0], color='royalblue').patches
+    elif args.color == 'bw':
+        bars = ax.barh(frame_pos[:, 0], frame_pop[:, 0], color='white', edgecolor='black', hatch='*').patches
+    else:
+        raise Exception('Wrong color')
+    shorts_texts = [ax.text(0, 0, short) for short in shorts]
+    artists = bars + shorts_texts + [year_text, ax.yaxis, ax.spines['left']]
+
+    def animate(i):
+        pos, pop = frame_pos[:, i], frame_pop[:, i]
+        year_text.set_text(label(times[i]))
+        for j in range(len(names)):
+            bars[j].set_y(pos[j] - 0.4)
+            bars[j].set_width(pop[j])
+            shorts_texts[j].set_position((pop[j] + 0.01 * max_x, pos[j]))
+        ax.set_yticks(pos)
+        ax.set_yticklabels(names)
+        return artists
+
+    return animate, times
+
+
+# top n countries in every frame, bars and labels are created once and reused for countries in view
+def race(fig, ax, data: dict, shorts: dict, years: np.ndarray, convert_dict: dict, formatter, label,
+         args) -> (callable, np.ndarray):
+    countries = list(data.keys())
+    times = tween.tween_times(years, args.frames_per_year)
+    values = to_matrix(data, countries, years)
+    frame_pop = tween.interpolate(values, years, times, args.interpolation)
+    frame_pos = tween.rank_positions(values, years, times)
+    # countries entering or leaving top n slide in or out below the last place
+    in_view = (frame_pos < args.top + 0.5) & ~np.isnan(frame_pop)
+    pool = int(in_view.sum(axis=0).max())
+    max_pop = np.nanmax(np.where(in_view, frame_pop, np.nan), axis=0)
+
+    plt.title(args.title if args.title else
+              f'Top {args.top} countries by population ({label(years[0])} - {label(years[-1])})', pad=20)
+    plt.xlabel('Population')
+    ax.xaxis.set_major_formatter(formatter)
+    ax.set_ylim(args.top - 0.5, -0.5)
+    ax.set_yticks([])
+    if args.color == 'color':
+        bars = ax.barh(np.zeros(pool), np.zeros(pool), color='royalblue').patches
+        colors = np.where(np.array(countries) == args.country, 'orange', 'royalblue')
+    elif args.color == 'bw':
+        bars = ax.barh(np.zeros(pool), np.zeros(pool), color='white', edgecolor='black', hatch='*').patches
+        colors = np.full(len(countries), 'white')
+    else:
+        raise Exception('Wrong color')
+    # labels of many bars must be smaller to fit
+    size = min(22, 220 // args.top)
+    names_trans = transforms.blended_transform_factory(ax.transAxes, ax.transData)
+    names = [ax.text(-0.01, 0, '', va='center', ha='right', transform=names_trans, size=size) for _ in range(pool)]
+    values_texts = [ax.text(0, 0, '', va='center', clip_on=True, size=size) for _ in range(pool)]
+    year_text = ax.text(0.95, 0.1, '', ha='right', transform=ax.transAxes, size=44)
+    country_names = [convert_dict.get(country, country) for country in countries]
+
+    def animate(i):
+        shown = np.flatnonzero(in_view[:, i])
+        ax.set_xlim(0, 1.1 * max_pop[i])
+        for slot in range(pool):
+            visible = slot < len(shown)
+            for artist in (bars[slot], names[slot], values_texts[slot]):
+                artist.set_visible(visible)
+            if not visible:
+                continue
+            country = shown[slot]
+            pos, pop = frame_pos[country, i], frame_pop[country, i]
+            bars[slot].set_y(pos - 0.4)
+            bars[slot].set_width(pop)
+            bars[slot].set_facecolor(colors[country])
+            # names are outside of axes, so they are hidden instead of clipped
+            names[slot].set_visible(pos < args.top - 0.5)
+            names[slot].set_y(pos)
+            names[slot].set_text(country_names[country])
+            values_texts[slot].set_position((pop + 0.01 * 1.1 * max_pop[i], pos))
+            values_texts[slot].set_text(shorts[countries[country]])
+        year_text.set_text(label(times[i]))
+        return ax
+
+    return animate, times
+
+
+# indices of frames (of given times) in selected years, all frames when years are not given
+def selected_frames(args, times: np.ndarray) -> np.ndarray:
+    if not args.years:
+        return np.arange(len(times))
+    first, last = args.years[0], args.years[-1]
+    if len(args.years) > 2 or not times[0] <= first <= last <= times[-1]:
+        raise Exception('Wrong years')
+    return np.flatnonzero((times >= first) & (times <= last))
+
+
+def parse_args(argv: list = None):
     parser = argparse.ArgumentParser()
     parser.add_argument('database', type=str)
     parser.add_argument('country', type=str, help='selected country')
     parser.add_argument('year', type=int, help='selected year')
     parser.add_argument('-t', '--title', type=str, help='title')
-    parser.add_argument('-m', '--mode', type=str, help='mode: barh, scatter, line, pie, gantt', default='barh')
+    parser.add_argument('-m', '--mode', type=str, help='mode: barh, scatter, line, pie, race, gantt',
+                        default='barh')
     parser.add_argument('-c', '--color', type=str, help='color: color, bw', default='color')
     parser.add_argument('-s', '--save', action='store_true', help='save plot', default=False)
     parser.add_argument('-d', '--density', type=str, help='density data filename')
+    parser.add_argument('-I', '--indicator', type=str, nargs=2, action='append', metavar=('NAME', 'FILE'),
+                        help='additional indicator data file (rows as in database), can be repeated')
+    parser.add_argument('--y-indicator', type=str, help='indicator on y axis in scatter mode', default='population')
+    parser.add_argument('--size', type=str, help='indicator of bubble size in scatter mode', default='density')
+    parser.add_argument('--size-scale', type=float, help='bubble area per unit of size indicator', default=20)
+    parser.add_argument('--hue', type=str, help='indicator of bubble color in scatter mode')
     parser.add_argument('-o', '--output', type=str, help='output', default='')
-    args = parser.parse_args()
-
-    data, shorts = parse_file(args.database)
-    if args.density:
-        density_data, density_shorts = parse_file(args.density, 'float')
-    not_countries = [
-        'World',
-        'IDA & IBRD total',
-        'Low & middle income',
-        'Middle income',
-        'IBRD only',
-        'Upper middle income',
-        'Late-demographic dividend',
-        'East Asia & Pacific',
-        'Early-demographic dividend',
-        'Lower middle income',
-        'East Asia & Pacific (excluding high income)',
-        'East Asia & Pacific (IDA & IBRD countries)',
-        'OECD members',
-        'High income',
-        'Post-demographic dividend',
-        'Europe & Central Asia',
-
-        'South Asia',
-        'South Asia (IDA & IBRD)',
-        'European Union',
-        'IDA total',
-        'Europe & Central Asia (IDA & IBRD countries)',
-        'Europe & Central Asia (excluding high income)',
-        'Euro area',
-        'IDA only',
-        'Least developed countries: UN classification',
-        'Sub-Saharan Africa',
-
-        'Sub-Saharan Africa (IDA & IBRD countries)',
-        'Sub-Saharan Africa (excluding high income)',
-        'Latin America & Caribbean',
-        'Latin America & the Caribbean (IDA & IBRD countries)',
-        'Latin America & Caribbean (excluding high income)',
-        'North America',
-        'Pre-demographic dividend',
-
-        'Heavily indebted poor countries (HIPC)',
-        'Low income',
-        'IDA blend',
-        'Fragile and conflict affected situations',
-
-        'Middle East & North Africa',
-        'Middle East & North Africa (excluding high income)',
-        'Middle East & North Africa (IDA & IBRD countries)',
-
-        'Arab World',
-        'Central Europe and the Baltics',
-
-    ]
-
-    for ncount in not_countries:
-        if ncount in data:
-            del data[ncount]
-
-    closest_5_start = pick_5_closest(args.country, data, args.year)
-    countries_5_closest_data = {country: data[country] for country in closest_5_start}
-    closest_5_stop = pick_5_closest(args.country, countries_5_closest_data, stop_year)
+    parser.add_argument('-f', '--frames-per-year', type=int, default=1,
+                        help='interpolated frames per year (per time step of data with monthly or daily header)')
+    parser.add_argument('-i', '--interpolation', type=str, help='interpolation: linear, cubic', default='linear')
+    parser.add_argument('-n', '--top', type=int, help='number of countries in race mode', default=10)
+    parser.add_argument('-y', '--years', type=int, nargs='+', metavar='YEAR',
+                        help='only frames of given year (saved as png) or years range FIRST LAST (saved as gif)')
+    parser.add_argument('-p', '--preview', action='store_true',
+                        help='fast preview with lower resolution and every few frames only, same layout')
+    cube.add_arguments(parser)
+    profiling.add_arguments(parser)
+    return parser.parse_args(argv)
+
+
+# figure, function drawing i-th frame and times of frames
+def animation(args) -> (object, callable, np.ndarray):
+    # all indicators are parsed once and aligned on country, each has its own time axis
+    with profiling.stage('load'):
+        files = {'population': args.database}
+        if args.density:
+            files['density'] = args.density
+        files.update(args.indicator or [])
+        indicators = cube.load_indicators(files, args)
+        # aggregate rows (World, regions, income groups) are not countries
+        data, shorts = indicators.to_dict('population', ~indicators.aggregate), indicators.shorts()
+        years = indicators.times['population']
+        label = indicators.label
+        last_year = years[-1]
+        period = f'{label(years[0])} - {label(last_year)}'
+        # space for labels right of last time, 2 years of 1960 - 2018
+        x_margin = (last_year - years[0]) / 29
+
+    with profiling.stage('select'):
+        closest_5_start = pick_5_closest(args.country, data, args.year)
+        countries_5_closest_data = {country: data[country] for country in closest_5_start}
+        closest_5_stop = pick_5_closest(args.country, countries_5_closest_data, last_year)
 
     font = {'size': 22}
 
@@ -143,91 +225,139 @@ def main():
     def millions(x, pos):
         return '%1.1fM' % (x * 1e-6)
 
-    max_x = 1.1 * data[closest_5_stop[0]][stop_year]
+    max_x = 1.1 * data[closest_5_stop[0]][last_year]
+    if args.mode == 'race':
+        max_x = 1.1 * max(max(country_data.values(), default=0) for country_data in data.values())
 
     formatter = ticker.FuncFormatter(millions if max_x < 300000000 else billions)
 
-    def init():
-        return ax
+    # values of all frames are interpolated before rendering
+    with profiling.stage('interpolate'):
+        times = tween.tween_times(years, args.frames_per_year)
+        values = indicators.matrix('population', closest_5_stop)
+        frame_pop = tween.interpolate(values, years, times, args.interpolation)
+        if args.frames_per_year > 1:
+            frame_pos = tween.rank_positions(values, years, times)
+        else:
+            frame_pos = np.repeat(np.arange(float(len(closest_5_stop)))[:, None], len(times), axis=1)
+        if args.mode == 'scatter':
+            frame_y, frame_size = (tween.indicator_frames(indicators, indicator, closest_5_stop, times, args.interpolation)
+                                   for indicator in (args.y_indicator, args.size))
+            max_y = 1.1 * data[closest_5_stop[0]][last_year] if args.y_indicator == 'population' else 1.1 * np.nanmax(frame_y)
+            bubble_colors = np.array(['red', 'orange', 'purple', 'blue', 'green'])[:len(closest_5_stop), None].repeat(
+                len(times), axis=1)
+            if args.hue:
+                # color scale is the same in all frames
+                frame_hue = tween.indicator_frames(indicators, args.hue, closest_5_stop, times, args.interpolation)
+                hue = plt.Normalize(np.nanmin(frame_hue), np.nanmax(frame_hue))
+                bubble_colors = plt.cm.viridis(hue(frame_hue))
+                fig.colorbar(plt.cm.ScalarMappable(norm=hue, cmap=plt.cm.viridis), ax=ax, label=args.hue)
 
     def animate(i):
         ax.clear()
         plt.title(
-            f'Population in similar to {args.country} in {args.year} countries ({start_year} - {stop_year})' if not args.title else args.title,
+            f'Population in similar to {args.country} in {args.year} countries ({period})' if not args.title else args.title,
             pad=20)
-        pop = [data[cntry][start_year + i] for cntry in closest_5_stop]
-        if args.mode == 'barh':
-            plt.xlabel('Population')
-            ax.set_xlim(0, 1.1 * data[closest_5_stop[0]][stop_year])
-            ax.xaxis.set_major_formatter(formatter)
-            ax.tick_params(axis='x', which='minor', direction='out', bottom=True, length=5)
-            ax.text(0.75, 0.82, f'{(start_year + i) % (stop_year + 1)}', transform=ax.transAxes, size=44)
-            if args.color == 'color':
-                ax.barh(countries_names, pop, color='royalblue')
-            elif args.color == 'bw':
-                ax.barh(countries_names, pop, color='white', edgecolor='black', hatch='*')
-            else:
-                raise Exception('Wrong color')
-            for j, country_name in enumerate(closest_5_stop):
-                value = pop[j] + 0.01 * 1.1 * data[closest_5_stop[0]][stop_year]
-                short = countries_shorts[j]
-                ax.text(value, j, short)
-        elif args.mode == 'pie':
-            ax.text(-0.2, 0.82, f'{(start_year + i) % (stop_year + 1)}', transform=ax.transAxes, size=44)
+        year = times[i]
+        pop = frame_pop[:, i]
+        if args.mode == 'pie':
+            ax.text(-0.2, 0.82, label(year), transform=ax.transAxes, size=44)
             ax.pie(pop, labels=countries_names, autopct='%1.1f%%')
         elif args.mode == 'scatter':
-            plt.ylabel('Population')
-            dens = [density_data[cntry][start_year + i] * 20 for cntry in closest_5_stop]
-            ax.set_ylim(0, 1.1 * data[closest_5_stop[0]][stop_year])
-            ax.set_xlim(start_year, stop_year + 2)
-            ax.yaxis.set_major_formatter(formatter)
-            ax.set_xticks([year for year in range(start_year, stop_year + 2)], minor=True)
-            ax.text(0.1, 0.82, f'{(start_year + i) % (stop_year + 1)}', transform=ax.transAxes, size=44)
-            ax.scatter([start_year + i for _ in range(5)], pop, s=dens, alpha=0.3, c=['red', 'orange', 'purple', 'blue', 'green'])
+            plt.ylabel(args.y_indicator.capitalize())
+            dens = frame_size[:, i] * args.size_scale
+            ax.set_ylim(0, max_y)
+            ax.set_xlim(years[0], last_year + x_margin)
+            if args.y_indicator == 'population':
+                ax.yaxis.set_major_formatter(formatter)
+            ax.set_xticks(np.arange(np.ceil(years[0]), last_year + x_margin), minor=True)
+            ax.text(0.1, 0.82, label(year), transform=ax.transAxes, size=44)
+            ax.scatter([year for _ in closest_5_stop], frame_y[:, i], s=dens, alpha=0.3, c=list(bubble_colors[:, i]))
             for j, country_name in enumerate(closest_5_stop):
-                value = pop[j]
+                value = frame_y[j, i]
                 short = countries_shorts[j]
                 dx, dy = np.sqrt(dens[j] * 10) / fig.dpi / 2 + 10 / fig.dpi, 0.
                 offset = transforms.ScaledTranslation(dx, dy, fig.dpi_scale_trans)
-                ax.text(start_year + i, value, short, va='center', ha='left', transform=ax.transData + offset)
+                ax.text(year, value, short, va='center', ha='left', transform=ax.transData + offset)
         elif args.mode == 'line':
             plt.ylabel('Population')
-            ax.set_ylim(0, 1.1 * data[closest_5_stop[0]][stop_year])
-            ax.set_xlim(start_year, stop_year + 2)
+            ax.set_ylim(0, 1.1 * data[closest_5_stop[0]][last_year])
+            ax.set_xlim(years[0], last_year + x_margin)
             ax.yaxis.set_major_formatter(formatter)
-            ax.set_xticks([year for year in range(start_year, stop_year + 2)], minor=True)
-            ax.text(0.1, 0.82, f'{(start_year + i) % (stop_year + 1)}', transform=ax.transAxes, size=44)
-
-            # first must be present to connect lines
-            prev = cpop = [data[cntry][start_year] for cntry in closest_5_stop]
-            if i == 0:  # only when first frame
-                ax.scatter([start_year for _ in range(5)], cpop, c=['red', 'orange', 'purple', 'blue', 'green'])
-
-            for j in range(start_year + 1, start_year + i):
-                colors = ['red', 'orange', 'purple', 'blue', 'green']
-                cpop = [data[cntry][j] for cntry in closest_5_stop]
-                if j == start_year + i - 1:
-                    ax.scatter([j for _ in range(5)], cpop, c=colors)
-                for k in range(5):
-                    ax.plot([j - 1, j], [prev[k], cpop[k]], colors[k])
-                prev = cpop
+            ax.set_xticks(np.arange(np.ceil(years[0]), last_year + x_margin), minor=True)
+            ax.text(0.1, 0.82, label(year), transform=ax.transAxes, size=44)
+
+            # whole line up to current frame, point at current frame
+            colors = ['red', 'orange', 'purple', 'blue', 'green'][:len(closest_5_stop)]
+            for k in range(len(closest_5_stop)):
+                ax.plot(times[:i + 1], frame_pop[k, :i + 1], colors[k])
+            ax.scatter([year for _ in closest_5_stop], pop, c=colors)
             for j, country_name in enumerate(closest_5_stop):
                 value = pop[j]
                 short = countries_shorts[j]
                 dx, dy = 1 / fig.dpi / 2 + 10 / fig.dpi, 0.
                 offset = transforms.ScaledTranslation(dx, dy, fig.dpi_scale_trans)
-                ax.text(start_year + i, value, short, va='center', ha='left', transform=ax.transData + offset)
+                ax.text(year, value, short, va='center', ha='left', transform=ax.transData + offset)
 
         else:
             raise Exception('Wrong mode')
         return ax
 
-    anim = FuncAnimation(fig, animate, init_func=init,
-                         frames=stop_year - start_year + 1, interval=200, blit=False)
+    if args.mode == 'race':
+        with profiling.stage('race'):
+            return (fig,) + race(fig, ax, data, shorts, years, convert_dict, formatter, label, args)
+    if args.mode == 'barh':
+        plt.title(
+            f'Population in similar to {args.country} in {args.year} countries ({period})' if not args.title else args.title,
+            pad=20)
+        return (fig,) + barh(ax, times, frame_pop, frame_pos, countries_names, countries_shorts,
+                             1.1 * data[closest_5_stop[0]][last_year], formatter, label, args)
+    return fig, animate, times
+
 
-    if args.save:
-        anim.save(f'{args.output}{args.country}_{args.year}_closest_{args.mode}_{args.color}.gif', writer='imagemagick')
-    else:
+def main():
+    args = parse_args()
+    with profiling.session(args):
+        fig, animate, times = animation(args)
+        # only requested frames are drawn
+        frames = selected_frames(args, times)
+        interval = 200 / args.frames_per_year
+        filename = f'{args.output}{args.country}_{args.year}_closest_{args.mode}_{args.color}'
+        if args.years:
+            filename += '_' + '-'.join(str(year) for year in args.years)
+        dpi = None
+        if args.preview:
+            # every n-th and last frame shown n times longer, so preview has the same pace
+            frames = np.union1d(frames[::raster.preview_step], frames[-1:])
+            interval *= raster.preview_step
+            dpi = raster.preview_dpi
+            filename += '_preview'
+
+        # single year is a still image, e.g. poster frame of the animation
+        if args.save and len(args.years or []) == 1:
+            with profiling.stage('save'):
+                profiling.frames(animate)(frames[0])
+                fig.savefig(f'{filename}.png', dpi=dpi)
+            return
+
+        filename += '.gif'
+        # frames are encoded in another process while next ones are rendered
+        if args.save:
+            with profiling.stage('save'):
+                # barh frames change only bars and labels, so they are drawn over pre-rendered background
+                if args.mode == 'barh':
+                    raster.save_gif(fig, profiling.frames(animate), frames, filename, interval, dpi=dpi,
+                                    fast=args.preview)
+                else:
+                    raster.save_animation(fig, profiling.frames(animate), frames, filename, interval, dpi=dpi,
+                                          fast=args.preview)
+            return
+
+        def init():
+            return fig.axes
+
+        anim = FuncAnimation(fig, profiling.frames(animate), init_func=init, frames=frames, interval=interval,
+                             blit=False)
         plt.show()
 
 
@@ -1,28 +1,18 @@
 #!/usr/bin/env python3
 
 import argparse
-import csv
+import json
+import os
 import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib import transforms
 from matplotlib.animation import FuncAnimation
 import matplotlib.ticker as ticker
 
-
-start_year = 1960
-stop_year = 2018
-
-
-# return {country: {year: population}} + {country: {short name}}
-def parse_file(filename: str, data_type='int') -> (dict, dict):
-    countries = {}
-    shorts = {}
-    with open(filename) as csvfile:
-        spamreader = csv.reader(csvfile, delimiter=';')
-        for row in spamreader:
-            countries[row[0]] = {start_year + i - 2: int(row[i]) if data_type == 'int' else float(row[i]) for i in range(2, len(row)) if row[i]}
-            shorts[row[0]] = row[1]
-    return countries, shorts
+import profiling
+import raster
+import cube
+import tween
 
 
 def pick_5_closest(country: str, data: dict, year: int):
@@ -51,16 +41,45 @@ def pick_5_closest(country: str, data: dict, year: int):
     return list(closest_5_sorted.keys())
 
 
-ry = 0
-pause_dur = 10
-pause_dur2 = 10
+# frames added on start and stop year of event, so it is visible for a while
+default_hold = 10
+
+
+# events {start, stop, hold, overlays: [{text, x, y, size}]}, overlays are shown from start to stop year
+def load_timeline(filename: str) -> list:
+    with open(filename) as timeline:
+        return json.load(timeline)['events']
+
+
+# gifs of timeline file are named after it (gulf_war_timeline.json - gulf_war), of one event 'event'
+def timeline_name(events: str) -> str:
+    if not events:
+        return 'event'
+    name = os.path.splitext(os.path.basename(events))[0]
+    return name[:-len('_timeline')] if name.endswith('_timeline') else name
+
+
+# schedule of all frames, every frame is (time, indices of events shown in it),
+# with n frames per step of time index (year, month, day)
+def compile_timeline(events: list, index: np.ndarray, steps=1) -> list:
+    schedule = []
+    index = index.tolist()
+    for k, year in enumerate(index):
+        active = tuple(i for i, event in enumerate(events) if event['start'] <= year <= event['stop'])
+        holds = sum(event.get('hold', default_hold) * ((year == event['start']) + (year == event['stop']))
+                    for event in events)
+        schedule += [(year, active)] * (1 + holds)
+        if k + 1 < len(index):
+            schedule += [(year + (index[k + 1] - year) * step / steps, active) for step in range(1, steps)]
+    return schedule
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('database', type=str)
-    parser.add_argument('start_year', type=int, help='event start year')
-    parser.add_argument('stop_year', type=int, help='event stop year')
+    parser.add_argument('start_year', type=int,
+                        help='event start year, countries are ordered by population in it (also with -e)')
+    parser.add_argument('stop_year', type=int, help='event stop year, not used with -e (events come from timeline)')
     parser.add_argument('countries', type=str, nargs='+', help='selected countries')
     parser.add_argument('-t', '--title', type=str, help='title')
     parser.add_argument('-m', '--mode', type=str, help='mode: barh, scatter, line, pie, gantt', default='barh')
@@ -68,69 +87,37 @@ def main():
     parser.add_argument('-s', '--save', action='store_true', help='save plot', default=False)
     parser.add_argument('-d', '--density', type=str, help='density data filename')
     parser.add_argument('-o', '--output', type=str, help='output', default='')
+    parser.add_argument('-e', '--events', type=str,
+                        help='timeline json file instead of one event from start to stop year, gif is named after it')
+    parser.add_argument('-f', '--frames-per-year', type=int, default=1,
+                        help='interpolated frames per year (per time step of data with monthly or daily header)')
+    parser.add_argument('-i', '--interpolation', type=str, help='interpolation: linear, cubic', default='linear')
+    cube.add_arguments(parser)
+    profiling.add_arguments(parser)
     args = parser.parse_args()
 
-    data, shorts = parse_file(args.database)
-    if args.density:
-        density_data, density_shorts = parse_file(args.density, 'float')
-    not_countries = [
-        'World',
-        'IDA & IBRD total',
-        'Low & middle income',
-        'Middle income',
-        'IBRD only',
-        'Upper middle income',
-        'Late-demographic dividend',
-        'East Asia & Pacific',
-        'Early-demographic dividend',
-        'Lower middle income',
-        'East Asia & Pacific (excluding high income)',
-        'East Asia & Pacific (IDA & IBRD countries)',
-        'OECD members',
-        'High income',
-        'Post-demographic dividend',
-        'Europe & Central Asia',
-
-        'South Asia',
-        'South Asia (IDA & IBRD)',
-        'European Union',
-        'IDA total',
-        'Europe & Central Asia (IDA & IBRD countries)',
-        'Europe & Central Asia (excluding high income)',
-        'Euro area',
-        'IDA only',
-        'Least developed countries: UN classification',
-        'Sub-Saharan Africa',
-
-        'Sub-Saharan Africa (IDA & IBRD countries)',
-        'Sub-Saharan Africa (excluding high income)',
-        'Latin America & Caribbean',
-        'Latin America & the Caribbean (IDA & IBRD countries)',
-        'Latin America & Caribbean (excluding high income)',
-        'North America',
-        'Pre-demographic dividend',
-
-        'Heavily indebted poor countries (HIPC)',
-        'Low income',
-        'IDA blend',
-        'Fragile and conflict affected situations',
-
-        'Middle East & North Africa',
-        'Middle East & North Africa (excluding high income)',
-        'Middle East & North Africa (IDA & IBRD countries)',
-
-        'Arab World',
-        'Central Europe and the Baltics',
-
-    ]
-
-    for ncount in not_countries:
-        if ncount in data:
-            del data[ncount]
-
-    countries = {country: data[country] for country in args.countries}
-    countries = {k: v for k, v in sorted(countries.items(), key=lambda item: item[1][args.start_year], reverse=True)}
-    countries = list(countries.keys())
+    with profiling.session(args):
+        event_animation(args)
+
+
+def event_animation(args):
+    with profiling.stage('load'):
+        files = {'population': args.database}
+        if args.density:
+            files['density'] = args.density
+        indicators = cube.load_indicators(files, args)
+        # aggregate rows (World, regions, income groups) are not countries
+        data, shorts = indicators.to_dict('population', ~indicators.aggregate), indicators.shorts()
+        years = indicators.times['population']
+        label = indicators.label
+        last_year = years[-1]
+        # space for labels right of last time, 2 years of 1960 - 2018
+        x_margin = (last_year - years[0]) / 29
+
+    with profiling.stage('select'):
+        countries = {country: data[country] for country in args.countries}
+        countries = {k: v for k, v in sorted(countries.items(), key=lambda item: item[1].get(args.start_year, 0), reverse=True)}
+        countries = list(countries.keys())
 
     font = {'size': 22}
 
@@ -149,108 +136,120 @@ def main():
     def millions(x, pos):
         return '%1.1fM' % (x * 1e-6)
 
-    max_x = 1.1 * data[countries[0]][stop_year]
+    max_x = 1.1 * data[countries[0]][last_year]
 
     formatter = ticker.FuncFormatter(millions if max_x < 300000000 else billions)
 
+    with profiling.stage('timeline'):
+        events = load_timeline(args.events) if args.events else [{'start': args.start_year, 'stop': args.stop_year}]
+        schedule = compile_timeline(events, years, args.frames_per_year)
+
+        # values in all frame times are interpolated before rendering
+        times = np.unique([time for time, _ in schedule])
+        values = indicators.matrix('population', countries)
+        frame_pop = tween.interpolate(values, years, times, args.interpolation)
+        if args.frames_per_year > 1:
+            frame_pos = tween.rank_positions(values, years, times)
+        else:
+            frame_pos = np.repeat(np.arange(float(len(countries)))[:, None], len(times), axis=1)
+        if args.density:
+            frame_dens = tween.indicator_frames(indicators, 'density', countries, times, args.interpolation)
+    # overlays are created once and only shown or hidden in frames
+    overlays = [[fig.text(o['x'], o['y'], o['text'], transform=ax.transAxes, size=o.get('size', 30), visible=False)
+                 for o in event.get('overlays', [])] for event in events]
+    last_frame = []
+
     def init():
         return ax
 
-    def animate(i):
-        global ry, pause_dur, pause_dur2
-        current_year = (start_year + ry) % (stop_year + 1)
-        ry += 1
-        if current_year == args.start_year:
-            if pause_dur:
-                pause_dur -= 1
-                ry -= 1
-        if current_year == args.stop_year:
-            if pause_dur2:
-                pause_dur2 -= 1
-                ry -= 1
-
-        i = ry
+    # frame depends only on its (time, events), so frames can be rendered in any order
+    def animate(frame):
+        time, active = frame
+        i = np.searchsorted(times, time)
+        year = label(time)
+        # held frames are the same as previous one
+        if last_frame == [frame]:
+            return ax
+        last_frame[:] = [frame]
+        for j, texts in enumerate(overlays):
+            for text in texts:
+                text.set_visible(j in active)
+
         ax.clear()
         plt.title(args.title, pad=20)
-        pop = [data[cntry][current_year] for cntry in countries]
+        pop = frame_pop[:, i]
         if args.mode == 'barh':
             plt.xlabel('Population')
-            ax.set_xlim(0, 1.1 * data[countries[0]][stop_year])
+            ax.set_xlim(0, 1.1 * data[countries[0]][last_year])
             ax.xaxis.set_major_formatter(formatter)
             ax.tick_params(axis='x', which='minor', direction='out', bottom=True, length=len(countries))
-            ax.text(0.75, 0.82, f'{(start_year + i) % (stop_year + 1)}', transform=ax.transAxes, size=44)
+            ax.text(0.75, 0.82, f'{year}', transform=ax.transAxes, size=44)
+            pos = frame_pos[:, i]
             if args.color == 'color':
-                ax.barh(countries_names, pop, color='royalblue')
+                ax.barh(pos, pop, color='royalblue')
             elif args.color == 'bw':
-                ax.barh(countries_names, pop, color='white', edgecolor='black', hatch='*')
+                ax.barh(pos, pop, color='white', edgecolor='black', hatch='*')
             else:
                 raise Exception('Wrong color')
+            ax.set_yticks(pos)
+            ax.set_yticklabels(countries_names)
+            ax.set_ylim(-0.6, len(countries) - 0.4)
             for j, country_name in enumerate(countries):
-                value = pop[j] + 0.01 * 1.1 * data[countries[0]][stop_year]
+                value = pop[j] + 0.01 * 1.1 * data[countries[0]][last_year]
                 short = countries_shorts[j]
-                ax.text(value, j, short)
+                ax.text(value, pos[j], short)
         elif args.mode == 'pie':
-            ax.text(-0.2, 0.82, f'{(start_year + i) % (stop_year + 1)}', transform=ax.transAxes, size=44)
+            ax.text(-0.2, 0.82, f'{year}', transform=ax.transAxes, size=44)
             ax.pie(pop, labels=countries_names, autopct='%1.1f%%')
         elif args.mode == 'scatter':
             plt.ylabel('Population')
-            dens = [density_data[cntry][start_year + i] * 20 for cntry in countries]
-            ax.set_ylim(0, 1.1 * data[countries[0]][stop_year])
-            ax.set_xlim(start_year, stop_year + 2)
+            dens = frame_dens[:, i] * 20
+            ax.set_ylim(0, 1.1 * data[countries[0]][last_year])
+            ax.set_xlim(years[0], last_year + x_margin)
             ax.yaxis.set_major_formatter(formatter)
-            ax.set_xticks([year for year in range(start_year, stop_year + 2)], minor=True)
-            ax.text(0.1, 0.82, f'{(start_year + i) % (stop_year + 1)}', transform=ax.transAxes, size=44)
-            ax.scatter([start_year + i for _ in range(len(countries))], pop, s=dens, alpha=0.3, c=['red', 'orange', 'purple', 'blue', 'green'])
+            ax.set_xticks(np.arange(np.ceil(years[0]), last_year + x_margin), minor=True)
+            ax.text(0.1, 0.82, f'{year}', transform=ax.transAxes, size=44)
+            ax.scatter([time for _ in range(len(countries))], pop, s=dens, alpha=0.3, c=['red', 'orange', 'purple', 'blue', 'green'])
             for j, country_name in enumerate(countries):
                 value = pop[j]
                 short = countries_shorts[j]
                 dx, dy = np.sqrt(dens[j] * 10) / fig.dpi / 2 + 10 / fig.dpi, 0.
                 offset = transforms.ScaledTranslation(dx, dy, fig.dpi_scale_trans)
-                ax.text(start_year + i, value, short, va='center', ha='left', transform=ax.transData + offset)
+                ax.text(time, value, short, va='center', ha='left', transform=ax.transData + offset)
         elif args.mode == 'line':
             plt.ylabel('Population')
-            ax.set_ylim(0, 1.1 * data[countries[0]][stop_year])
-            ax.set_xlim(start_year, stop_year + 2)
+            ax.set_ylim(0, 1.1 * data[countries[0]][last_year])
+            ax.set_xlim(years[0], last_year + x_margin)
             ax.yaxis.set_major_formatter(formatter)
-            ax.set_xticks([year for year in range(start_year, stop_year + 2)], minor=True)
-            ax.text(0.1, 0.82, f'{(start_year + i) % (stop_year + 1)}', transform=ax.transAxes, size=44)
-
-            # first must be present to connect lines
-            prev = cpop = [data[cntry][start_year] for cntry in countries]
-            if i == 0:  # only when first frame
-                ax.scatter([start_year for _ in range(len(countries))], cpop, c=['red', 'orange', 'purple', 'blue', 'green'])
-
-            for j in range(start_year + 1, start_year + i):
-                colors = ['red', 'orange', 'purple', 'blue', 'green']
-                cpop = [data[cntry][j] for cntry in countries]
-                if j == start_year + i - 1:
-                    ax.scatter([j for _ in range(len(countries))], cpop, c=colors)
-                for k in range(len(countries)):
-                    ax.plot([j - 1, j], [prev[k], cpop[k]], colors[k])
-                prev = cpop
+            ax.set_xticks(np.arange(np.ceil(years[0]), last_year + x_margin), minor=True)
+            ax.text(0.1, 0.82, f'{year}', transform=ax.transAxes, size=44)
+
+            # whole line up to current frame, point at current frame
+            colors = ['red', 'orange', 'purple', 'blue', 'green']
+            for k in range(len(countries)):
+                ax.plot(times[:i + 1], frame_pop[k, :i + 1], colors[k])
+            ax.scatter([time for _ in range(len(countries))], pop, c=colors[:len(countries)])
             for j, country_name in enumerate(countries):
                 value = pop[j]
                 short = countries_shorts[j]
                 dx, dy = 1 / fig.dpi / 2 + 10 / fig.dpi, 0.
                 offset = transforms.ScaledTranslation(dx, dy, fig.dpi_scale_trans)
-                ax.text(start_year + i, value, short, va='center', ha='left', transform=ax.transData + offset)
+                ax.text(time, value, short, va='center', ha='left', transform=ax.transData + offset)
 
         else:
             raise Exception('Wrong mode')
-        if args.stop_year >= current_year >= args.start_year:
-            ax.text(0.32, 0.82, f'No data for Kuwait', transform=ax.transAxes, size=30)
-            ax.text(0.72, 0.62, f'Gulf War', transform=ax.transAxes, size=30)
-            ax.text(0.70, 0.52, f'(1990 - 1991)', transform=ax.transAxes, size=30)
         return ax
 
-    global pause_dur2, pause_dur
-    anim = FuncAnimation(fig, animate, init_func=init,
-                         frames=stop_year - start_year + 1 + pause_dur + pause_dur2, interval=200, blit=False)
-
+    # frames are encoded in another process while next ones are rendered
     if args.save:
-        anim.save(f'{args.output}event_{args.mode}_{args.color}.gif', writer='imagemagick')
-    else:
-        plt.show()
+        with profiling.stage('save'):
+            raster.save_animation(fig, profiling.frames(animate), schedule, f'{args.output}{timeline_name(args.events)}_{args.mode}_{args.color}.gif',
+                                  200 / args.frames_per_year, init=init)
+        return
+
+    anim = FuncAnimation(fig, profiling.frames(animate), init_func=init, frames=schedule,
+                         interval=200 / args.frames_per_year, blit=False)
+    plt.show()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+
+import numpy as np
+
+scripts_dir = os.path.dirname(os.path.abspath(__file__))
+
+population = 'data/population_edt_codes.csv'
+density = 'data/density_edt_codes.csv'
+temperature = 'data/temperature.csv'
+
+# synthetic datasets scale number of countries in population data and cities in temperature data,
+# 10x cities is already ~500k temperature records held as python objects by temp.py
+datasets = {
+    'bundled': {'countries': 1, 'cities': 1, 'monthly': False},
+    'x10': {'countries': 10, 'cities': 10, 'monthly': False},
+    'x100': {'countries': 100, 'cities': 10, 'monthly': False},
+    # 12 values per year in population data (with monthly header), so 12 animation frames per year
+    'monthly': {'countries': 1, 'cities': 1, 'monthly': True},
+}
+
+# number of frames saved by gif benchmark
+gif_frames = 20
+
+
+# every country row repeated with new name and values scaled by random factor
+def scale_countries(src: str, dst: str, factor: int, monthly: bool, rng):
+    from cube import first_year
+    with open(src) as src_file, open(dst, 'w', newline='') as dst_file:
+        writer = csv.writer(dst_file, delimiter=';')
+        rows = list(csv.reader(src_file, delimiter=';'))
+        if monthly:
+            months = 12 * max(len(row) - 2 for row in rows)
+            writer.writerow(['country', 'code'] + [f'{first_year + month // 12}-{month % 12 + 1:02d}'
+                                                   for month in range(months)])
+        for row in rows:
+            for k in range(factor):
+                scale = rng.lognormal(0, 0.2) if k else 1.
+                values = [float(value) * scale if value else np.nan for value in row[2:]]
+                if monthly:
+                    values = np.interp(np.arange(12 * len(values)) / 12, np.arange(len(values)), values)
+                is_int = all('.' not in value for value in row[2:])
+                writer.writerow([row[0] if not k else f'{row[0]} #{k}', row[1] if not k else f'{row[1]}{k}'] +
+                                ['' if np.isnan(value) else (str(round(value)) if is_int else str(value))
+                                 for value in values])
+
+
+# every temperature record repeated for new cities in new countries
+def scale_cities(src: str, dst: str, factor: int):
+    with open(src) as src_file, open(dst, 'w', newline='') as dst_file:
+        reader = csv.reader(src_file)
+        writer = csv.writer(dst_file, quoting=csv.QUOTE_NONNUMERIC)
+        writer.writerow(next(reader))
+        rows = list(reader)
+        for k in range(factor):
+            for row in rows:
+                record_id, city, country_id, country = row[0], row[6], row[7], row[8]
+                if k:
+                    record_id = str(int(record_id) + k * len(rows)) if record_id != '-1' else record_id
+                    city, country_id, country = f'{city} #{k}', f'{country_id}{k}', f'{country} #{k}'
+                writer.writerow([int(record_id)] + row[1:6] + [city, country_id, country] + row[9:])
+
+
+def dataset_files(name: str, directory: str) -> dict:
+    directory = os.path.join(directory, name)
+    return {
+        'directory': directory,
+        'population': os.path.join(directory, 'population.csv'),
+        'density': os.path.join(directory, 'density.csv'),
+        'temperature': os.path.join(directory, 'temperature.csv'),
+    }
+
+
+def generate_dataset(name: str, directory: str) -> dict:
+    files = dataset_files(name, directory)
+    os.makedirs(files['directory'], exist_ok=True)
+    spec = datasets[name]
+    rng = np.random.default_rng(0)
+    scale_countries(population, files['population'], spec['countries'], spec['monthly'], rng)
+    scale_countries(density, files['density'], spec['countries'], spec['monthly'], rng)
+    if spec['cities'] > 1:
+        scale_cities(temperature, files['temperature'], spec['cities'])
+    else:
+        shutil.copy(temperature, files['temperature'])
+    return files
+
+
+def anim_args(files: dict, mode: str):
+    from anim import parse_args
+    return parse_args([files['population'], 'Poland', '1960', '-m', mode, '-d', files['density']])
+
+
+def clean_temperature(files: dict) -> str:
+    return f'{files["temperature"][:-len(".csv")]}_clean.csv'
+
+
+# every benchmark prepares its input and returns function measured
+def bench_parse_file(files: dict):
+    from anim import parse_file
+    return lambda: parse_file(files['population'])
+
+
+def bench_cube_load(files: dict):
+    from cube import Cube
+    return lambda: Cube.load({'population': files['population'], 'density': files['density']})
+
+
+def bench_group_sum(files: dict):
+    from cube import Cube
+    indicators = Cube.load({'population': files['population']})
+    return lambda: indicators.group_sum('population', 'region')
+
+
+def bench_pick_5_closest(files: dict):
+    from anim import parse_file, pick_5_closest
+    data, _ = parse_file(files['population'])
+    return lambda: pick_5_closest('Poland', data, 1960)
+
+
+def bench_frame(mode: str):
+    def setup(files: dict):
+        from anim import animation
+        fig, animate, times = animation(anim_args(files, mode))
+
+        # last frame is the slowest one in line mode, which draws whole history
+        def run():
+            animate(len(times) - 1)
+            fig.canvas.draw()
+        return run
+    return setup
+
+
+def bench_gif(files: dict):
+    from matplotlib.animation import FuncAnimation, writers
+    from anim import animation
+    fig, animate, times = animation(anim_args(files, 'barh'))
+    writer = 'imagemagick' if writers.is_available('imagemagick') else 'pillow'
+    output = os.path.join(files['directory'], 'benchmark.gif')
+    return lambda: FuncAnimation(fig, animate, frames=min(len(times), gif_frames), blit=False).save(output, writer=writer)
+
+
+# barh gif drawn over cached background, as saved by anim.py
+def bench_gif_raster(files: dict):
+    import raster
+    from anim import animation
+    fig, animate, times = animation(anim_args(files, 'barh'))
+    output = os.path.join(files['directory'], 'benchmark.gif')
+    return lambda: raster.save_gif(fig, animate, min(len(times), gif_frames), output, 200)
+
+
+def bench_load_and_filter(files: dict):
+    from temp import load_and_filter
+
+    # clean csv is removed, so raw csv is always parsed and clean one written again
+    def run():
+        if os.path.exists(clean_temperature(files)):
+            os.remove(clean_temperature(files))
+        load_and_filter(files['temperature'])
+    return run
+
+
+def bench_load_clean(files: dict):
+    from temp import load_and_filter
+    load_and_filter(files['temperature'])
+    return lambda: load_and_filter(files['temperature'])
+
+
+def bench_get_cities_grouped(files: dict):
+    from temp import load_and_filter, get_cities_grouped
+    temps = load_and_filter(files['temperature'])
+    return lambda: get_cities_grouped(temps)
+
+
+def bench_prepare_dfs(files: dict):
+    import spain_covid19
+
+    def run():
+        spain_covid19._datasets.clear()
+        spain_covid19.prepare_dfs(spain_covid19.modes)
+    return run
+
+
+# same work as one frame of spain_covid19.communities_cases
+def bench_communities_frame(files: dict):
+    import matplotlib.pyplot as plt
+    import matplotlib.colors as colors
+    import spain_covid19
+    modes = spain_covid19.modes
+    map_dfs = spain_covid19.prepare_df_for_all(modes)
+    dates = spain_covid19.dataset_dates(spain_covid19.spain)
+    normalizes = {mode: colors.Normalize(map_dfs[mode][dates].values.min(), map_dfs[mode][dates].values.max())
+                  for mode in modes}
+    fig, axs = plt.subplots(2, 2, figsize=(15, 8))
+
+    def run():
+        for ax, mode in zip(axs.flat, modes):
+            ax.clear()
+            map_dfs[mode].plot(column=dates[-1], norm=normalizes[mode], cmap=spain_covid19.colormaps[mode],
+                               edgecolor='k', ax=ax)
+        fig.canvas.draw()
+    return run
+
+
+def bench_fit_fold(files: dict):
+    import pandas as pd
+    from forecast import fit
+    from temp import load_and_filter
+    load_and_filter(files['temperature'])
+    gdf = pd.read_csv(clean_temperature(files)).groupby(['Country', 'year'])[
+        'AverageTemperatureCelsius'].mean().reset_index()
+    cdf = gdf.groupby('Country').get_group(gdf['Country'].iloc[0])
+    return lambda: fit(cdf, 'AR', folds=1)
+
+
+# name: (setup, whether it runs on synthetic datasets too)
+benchmarks = {
+    'anim.parse_file': (bench_parse_file, True),
+    'cube.load': (bench_cube_load, True),
+    'cube.group_sum': (bench_group_sum, True),
+    'anim.pick_5_closest': (bench_pick_5_closest, True),
+    'anim.frame.barh': (bench_frame('barh'), True),
+    'anim.frame.pie': (bench_frame('pie'), True),
+    'anim.frame.scatter': (bench_frame('scatter'), True),
+    'anim.frame.line': (bench_frame('line'), True),
+    'anim.gif': (bench_gif, True),
+    'anim.gif.raster': (bench_gif_raster, True),
+    'temp.load_and_filter': (bench_load_and_filter, True),
+    'temp.load_clean': (bench_load_clean, True),
+    'temp.get_cities_grouped': (bench_get_cities_grouped, True),
+    'spain.prepare_dfs': (bench_prepare_dfs, False),
+    'spain.communities_frame': (bench_communities_frame, False),
+    'forecast.fit_fold': (bench_fit_fold, True),
+}
+
+
+# runs in fresh process, so peak rss and imports belong only to this benchmark
+def run_benchmark(name: str, files: dict, repeat: int, warmup: int) -> dict:
+    os.environ['MPLBACKEND'] = 'agg'
+    sys.path.insert(0, scripts_dir)
+    with redirect_stdout(io.StringIO()):
+        run = benchmarks[name][0](files)
+        # first runs also pay for lazy imports and caches
+        for _ in range(warmup):
+            run()
+        times, cpu_times = [], []
+        for _ in range(repeat):
+            wall, cpu = time.perf_counter(), time.process_time()
+            run()
+            times.append(time.perf_counter() - wall)
+            cpu_times.append(time.process_time() - cpu)
+        # tracing slows code down, so memory is measured in separate run
+        tracemalloc.start()
+        start = tracemalloc.get_traced_memory()[0]
+        run()
+        peak = tracemalloc.get_traced_memory()[1] - start
+        tracemalloc.stop()
+    return {
+        'times': times,
+        'min': min(times),
+        'median': statistics.median(times),
+        'cpu_median': statistics.median(cpu_times),
+        'peak_memory': peak,
+        'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, cwd=scripts_dir,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+# benchmarks slower than baseline by more than tolerance, as [(dataset, name, ratio)]
+def regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    slower = []
+    for dataset, dataset_results in results.items():
+        for name, result in dataset_results.items():
+            base = baseline.get(dataset, {}).get(name, {})
+            if 'median' in result and base.get('median'):
+                ratio = result['median'] / base['median']
+                if ratio > 1 + tolerance:
+                    slower.append((dataset, name, ratio))
+    return slower
+
+
+def main(args):
+    selected = [name for name in benchmarks if not args.benchmarks or
+                any(name.startswith(prefix) for prefix in args.benchmarks)]
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for dataset in args.datasets:
+            files = generate_dataset(dataset, directory)
+            results[dataset] = {}
+            for name in selected:
+                if dataset != 'bundled' and not benchmarks[name][1]:
+                    continue
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                    try:
+                        result = executor.submit(run_benchmark, name, files, args.repeat, args.warmup).result()
+                    except Exception as e:
+                        result = {'error': repr(e)}
+                results[dataset][name] = result
+                if 'error' in result:
+                    print(f'[-] {dataset} {name}: {result["error"]}', file=sys.stderr)
+                else:
+                    print(f'[+] {dataset} {name}: {result["median"] * 1000:.1f}ms '
+                          f'(min {result["min"] * 1000:.1f}ms, peak {result["peak_memory"] / 2 ** 20:.1f}MiB, '
+                          f'rss {result["max_rss"] / 2 ** 20:.0f}MiB)', file=sys.stderr)
+
+    report = {
+        'meta': {'commit': git_commit(), 'python': platform.python_version(), 'platform': platform.platform(),
+                 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'repeat': args.repeat, 'warmup': args.warmup},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            slower = regressions(results, json.load(baseline)['results'], args.tolerance)
+        for dataset, name, ratio in slower:
+            print(f'[SLOWER] {dataset} {name}: {ratio:.2f}x baseline', file=sys.stderr)
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmarks', type=str, nargs='*', help='run only benchmarks starting with given names')
+    parser.add_argument('-d', '--datasets', type=str, nargs='+', choices=list(datasets), default=['bundled'],
+                        help='datasets to run benchmarks on')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='number of measured runs per benchmark')
+    parser.add_argument('-w', '--warmup', type=int, default=1, help='number of not measured runs per benchmark')
+    parser.add_argument('-o', '--output', type=str, help='json output filename, printed if not provided')
+    parser.add_argument('-c', '--compare', type=str, help='baseline json, exit with 1 if any benchmark is slower')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.2, help='allowed slowdown against baseline')
+    parsed_args = parser.parse_args()
+
+    main(parsed_args)
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+import argparse
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+scripts_dir = os.path.dirname(os.path.abspath(__file__))
+manifest_file = '.build_manifest.json'
+
+population = 'data/population_edt_codes.csv'
+density = 'data/density_edt_codes.csv'
+temperature = 'data/temperature.csv'
+# aggregate rows of population data are excluded by it
+metadata = 'data/countries_meta.csv'
+
+
+# same charts as build_scripts/lab*.sh, every target is {name, script, args, inputs, outputs}
+def lab5_targets() -> list:
+    targets = []
+    most_populated = 'Population in 5 most populated countries (1960 - 2018)'
+    titles = {
+        'barh': most_populated,
+        'scatter': 'Population in 5 most populated countries with density (1960 - 2018)',
+        'line': most_populated,
+        'pie': 'Population % share within 5 most populated countries (1960 - 2018)',
+    }
+    for mode, colors in [('barh', ['color', 'bw']), ('scatter', ['color']), ('line', ['color']), ('pie', ['color'])]:
+        for country, year in [('China', 2018), ('Poland', 1960), ('Chile', 1960)]:
+            for color in colors:
+                args = [population, country, str(year), '-m', mode, '-c', color, '-s', '-o', f'{mode}/']
+                inputs = [population, metadata]
+                if country == 'China':
+                    args += ['-t', titles[mode]]
+                if mode == 'scatter':
+                    args += ['-d', density]
+                    inputs.append(density)
+                targets.append({
+                    'name': f'{mode}/{country}_{year}_{color}',
+                    'script': 'anim.py',
+                    'args': args,
+                    'inputs': inputs,
+                    'outputs': [f'{mode}/{country}_{year}_closest_{mode}_{color}.gif'],
+                })
+    targets.append({
+        'name': 'event/gulf_war',
+        'script': 'anim_select.py',
+        'args': [population, '1990', '1991', 'Iraq', 'Saudi Arabia', 'Kuwait', 'Mongolia',
+                 '-t', 'Population in countries participated in Gulf War (and Mongolia)',
+                 '-e', 'data/gulf_war_timeline.json', '-s', '-o', 'event/'],
+        'inputs': [population, metadata, 'data/gulf_war_timeline.json'],
+        'outputs': ['event/gulf_war_barh_color.gif'],
+    })
+    return targets
+
+
+def lab7_targets() -> list:
+    tasks = {
+        'task2a': ['scatter', '-f', 'none'],
+        'task2b': ['scatter', '-f', 'black', '-g'],
+        'task2c': ['scatter', '-f', 'black', '-g', '-a', '0.05'],
+        'task2d': ['scatter', '-f', 'black', '-g', '-a', '0.05', '-e', 'blue'],
+        'task3a': ['boxplot', '-g'],
+        'task3b': ['boxplot', '-g', '-p', '-a', '0'],
+        'task3c': ['violin', '-g'],
+        'task4a': ['time', '-g'],
+        'task4b': ['time', '-gr'],
+        'task4c': ['time', '-gr', '-e', 'color-graph'],
+        'task5a': ['grid', '-g', '-e', 'color-graph'],
+        'task5b': ['grid', '-gc', '-e', 'color-graph'],
+        'task5c': ['grid', '-gc', '-e', 'color-graph'],
+        'task5d': ['grid', '-gcst', '-e', 'color-graph'],
+        'task5e': ['grid', '-gcsb', '-e', 'color-graph'],
+    }
+    targets = [{
+        'name': f'images/{task}',
+        'script': 'temp.py',
+        'args': [temperature, *args, '-o', f'images/{task}.png'],
+        'inputs': [temperature],
+        'outputs': [f'images/{task}.png'],
+    } for task, args in tasks.items()]
+    targets.append({
+        'name': 'docs/plots',
+        'script': 'images_to_pdf.py',
+        'args': ['images', '-o', 'docs/plots.pdf'],
+        'inputs': [output for target in targets for output in target['outputs']],
+        'outputs': ['docs/plots.pdf'],
+    })
+    return targets
+
+
+def lab9_targets() -> list:
+    targets = []
+    for country in ['Poland', 'Chile', 'Denmark', 'Ukraine', 'China', 'Finland']:
+        for lib in ['plotly', 'bokeh', 'altair']:
+            for plot in ['line', 'scatter']:
+                output = f'plots/{lib}_{plot}_{country}.html'
+                targets.append({
+                    'name': output[:-len('.html')],
+                    'script': 'inter.py',
+                    'args': [population, country, '1960', lib, plot, '-a', 'plots/assets', '-o', output],
+                    'inputs': [population, metadata],
+                    'outputs': [output],
+                })
+    targets.append({
+        'name': 'report',
+        'script': 'merge_htmls.py',
+        'args': ['plots', '-o', 'report.html'],
+        'inputs': [output for target in targets for output in target['outputs']],
+        'outputs': ['report.html'],
+    })
+    return targets
+
+
+def spain_targets() -> list:
+    return [{
+        'name': 'spain_plots',
+        'script': 'spain_covid19.py',
+        'args': [],
+        'inputs': ['covid'],
+        'outputs': ['spain_plots/0_spain_com_anim_(norm).gif', 'spain_plots/1_spain_com_anim_(lognorm).gif',
+                    'spain_plots/2_spain_com_interactive_2020-05-18.html', 'spain_plots/3_spain_unemployment.html',
+                    'spain_plots/4_spain_CPI.html'],
+    }]
+
+
+def all_targets() -> list:
+    return lab5_targets() + lab7_targets() + lab9_targets() + spain_targets()
+
+
+def input_files(path: str) -> list:
+    if os.path.isdir(path):
+        return sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    return [path]
+
+
+# script and local modules it imports (anywhere in the code, also in functions), recursively
+def local_modules(script: str) -> list:
+    modules, pending = [], [script]
+    while pending:
+        path = os.path.join(scripts_dir, pending.pop())
+        if path in modules or not os.path.exists(path):
+            continue
+        modules.append(path)
+        with open(path) as source:
+            tree = ast.parse(source.read(), path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            pending += [f'{name.split(".")[0]}.py' for name in names
+                        if os.path.exists(os.path.join(scripts_dir, f'{name.split(".")[0]}.py'))]
+    return sorted(modules)
+
+
+# hash of source of script and its local modules, arguments and content of every input file
+def target_hash(target: dict) -> str:
+    digest = hashlib.sha256()
+    digest.update(json.dumps([target['script'], target['args']]).encode())
+    for path in local_modules(target['script']) + [f for i in target['inputs'] for f in input_files(i)]:
+        digest.update(path.encode())
+        if not os.path.exists(path):
+            digest.update(b'missing')
+            continue
+        with open(path, 'rb') as input_file:
+            for chunk in iter(lambda: input_file.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_stale(target: dict, digest: str, manifest: dict) -> bool:
+    return manifest.get(target['name']) != digest or not all(os.path.exists(o) for o in target['outputs'])
+
+
+def load_manifest() -> dict:
+    if not os.path.exists(manifest_file):
+        return {}
+    with open(manifest_file) as manifest:
+        return json.load(manifest)
+
+
+def save_manifest(manifest: dict):
+    with open(f'{manifest_file}.tmp', 'w') as tmp_manifest:
+        json.dump(manifest, tmp_manifest, indent=2, sort_keys=True)
+    os.replace(f'{manifest_file}.tmp', manifest_file)
+
+
+# run script in its own python process, same as calling it from shell (with agg backend),
+# so no state (matplotlib rc, caches) is shared between targets
+def run_target(target: dict):
+    for output in target['outputs']:
+        if os.path.dirname(output):
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+    env = {**os.environ, 'MPLBACKEND': 'agg'}
+    subprocess.run([sys.executable, os.path.join(scripts_dir, target['script']), *target['args']], env=env, check=True)
+
+
+# target depends on targets producing any of its inputs
+def dependencies(targets: list) -> dict:
+    producers = {output: target['name'] for target in targets for output in target['outputs']}
+    deps = {}
+    for target in targets:
+        deps[target['name']] = {
+            producer for output, producer in producers.items()
+            for i in target['inputs'] if output == i or output.startswith(f'{i.rstrip("/")}/')
+        } - {target['name']}
+    return deps
+
+
+def main(args):
+    targets = all_targets()
+    deps = dependencies(targets)
+    if args.targets:
+        # selected targets together with everything they depend on
+        selected = {t['name'] for t in targets if any(t['name'].startswith(name) for name in args.targets)}
+        while any(deps[name] - selected for name in selected):
+            selected |= {dep for name in selected for dep in deps[name]}
+        targets = [target for target in targets if target['name'] in selected]
+    manifest = load_manifest()
+
+    pending = {target['name']: target for target in targets}
+    done, failed, stale = set(), set(), set()
+    running = {}
+    # every target is a separate process, threads only wait for them
+    with ThreadPoolExecutor(max_workers=args.jobs or os.cpu_count()) as executor:
+        while pending or running:
+            for name in [n for n in pending if deps[n] & failed]:
+                print(f'[-] {name}: skipped, dependency failed')
+                failed.add(name)
+                del pending[name]
+
+            # hash only when dependencies are built, so their new content is included
+            for name in [n for n in pending if deps[n] <= done]:
+                target = pending.pop(name)
+                digest = target_hash(target)
+                if not args.force and not deps[name] & stale and not is_stale(target, digest, manifest):
+                    done.add(name)
+                elif args.dry_run:
+                    print(f'[*] {name}: stale')
+                    stale.add(name)
+                    done.add(name)
+                else:
+                    print(f'[*] {name}: building')
+                    running[executor.submit(run_target, target)] = (name, digest)
+
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, digest = running.pop(future)
+                if future.exception():
+                    print(f'[-] {name}: {future.exception()!r}')
+                    failed.add(name)
+                else:
+                    print(f'[+] {name}')
+                    manifest[name] = digest
+                    save_manifest(manifest)
+                    done.add(name)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('targets', type=str, nargs='*', help='build only targets starting with given names')
+    parser.add_argument('-j', '--jobs', type=int, help='number of parallel workers, all cpus by default')
+    parser.add_argument('-f', '--force', action='store_true', help='rebuild targets even if up to date')
+    parser.add_argument('-n', '--dry-run', action='store_true', help='only print stale targets')
+    parsed_args = parser.parse_args()
+
+    main(parsed_args)
@@ -29,7 +29,7 @@ mkdir gantt
 ./anim.py "data/population_edt_codes.csv" Chile 1960 -m pie -s -o "pie/"
 
 # generate population plot for Gulf War
-./anim_select.py "data/population_edt_codes.csv" 1990 1991 "Iraq" "Saudi Arabia" "Kuwait" "Mongolia" -t "Population in countries participated in Gulf War (and Mongolia)" -s -o "event/"
+./anim_select.py "data/population_edt_codes.csv" 1990 1991 "Iraq" "Saudi Arabia" "Kuwait" "Mongolia" -t "Population in countries participated in Gulf War (and Mongolia)" -e "data/gulf_war_timeline.json" -s -o "event/"
 
 # generate Gantt plots for UW calendar, manually saved to files
 ./gantt.py
\ No newline at end of file
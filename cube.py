@@ -0,0 +1,192 @@
+import csv
+import datetime
+import os
+
+import numpy as np
+
+# files without header have yearly values from this year
+first_year = 1960
+# time resolutions from the coarsest one
+resolutions = ['year', 'month', 'day']
+# rows "country;code;region;income;aggregate" of every country and of aggregate rows (World, regions, income groups)
+default_metadata = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'countries_meta.csv')
+# metadata columns countries can be grouped by
+group_columns = ['region', 'income']
+
+
+# time label (2018, 2018-03 or 2018-03-15) as fractional year and its resolution
+def parse_time(label: str) -> (float, str):
+    parts = [int(part) for part in label.split('-')]
+    if len(parts) == 1:
+        return parts[0], 'year'
+    if len(parts) == 2:
+        return parts[0] + (parts[1] - 1) / 12, 'month'
+    date = datetime.date(*parts)
+    start = datetime.date(date.year, 1, 1)
+    return date.year + (date - start).days / (datetime.date(date.year + 1, 1, 1) - start).days, 'day'
+
+
+# fractional year as label of time it falls in
+def time_label(time: float, resolution: str = 'year') -> str:
+    # small tolerance, so sums of fractions land in their time
+    year = int(np.floor(time + 1e-9))
+    if resolution == 'year':
+        return f'{year}'
+    if resolution == 'month':
+        return f'{year}-{int((time - year) * 12 + 1e-6) + 1:02d}'
+    start = datetime.date(year, 1, 1)
+    days = (datetime.date(year + 1, 1, 1) - start).days
+    return (start + datetime.timedelta(days=int((time - year) * days + 1e-6))).isoformat()
+
+
+# rows "country;code;value;..." as times, their resolution and (name, code, values), nan where value is missing,
+# times are in optional header "country;code;1960;1961;..." (or 1960-01, 1960-01-01), yearly from first_year without it
+def read_rows(filename: str) -> (np.ndarray, str, list):
+    with open(filename) as csvfile:
+        rows = list(csv.reader(csvfile, delimiter=';'))
+    times, resolution = None, 'year'
+    if rows and rows[0][1].strip().lower() in ('code', 'country code'):
+        header = [label for label in rows.pop(0)[2:] if label]
+        times, labels_resolutions = zip(*(parse_time(label) for label in header))
+        times = np.array(times)
+        resolution = max(labels_resolutions, key=resolutions.index)
+        if np.any(np.diff(times) <= 0):
+            raise Exception(f'Wrong time axis in {filename}')
+    rows = [(row[0], row[1], [float(value) if value else np.nan for value in row[2:]]) for row in rows]
+    if times is None:
+        times = first_year + np.arange(max(len(values) for _, _, values in rows))
+    return times, resolution, rows
+
+
+# {code: {region, income, aggregate}}
+def read_metadata(filename: str) -> dict:
+    with open(filename) as csvfile:
+        return {row['code']: {'region': row['region'], 'income': row['income'], 'aggregate': row['aggregate'] == '1'}
+                for row in csv.DictReader(csvfile, delimiter=';')}
+
+
+# any number of indicators (population, density, ...) of countries, aligned on country code, every indicator is
+# countries x times matrix on its own time axis (yearly, monthly, daily, series may start late), nan where it has no value
+# with region, income group and aggregate flag of every country from metadata ('' and False when unknown)
+class Cube(object):
+    def __init__(self, names: list, codes: list, times: dict, values: dict, resolution: str = 'year',
+                 metadata: dict = None):
+        self.indicators = list(values)
+        self.names = names
+        self.codes = codes
+        self.times = times
+        self.values = values
+        self.resolution = resolution
+        self.rows = {name: i for i, name in enumerate(names)}
+        metadata = metadata or {}
+        self.meta = {column: np.array([metadata.get(code, {}).get(column, '') for code in codes], dtype=object)
+                     for column in group_columns}
+        self.aggregate = np.array([metadata.get(code, {}).get('aggregate', False) for code in codes], dtype=bool)
+
+    # {indicator: filename}, every file is parsed once, countries missing in some file have only nans there,
+    # without metadata (None) no row is aggregate
+    @classmethod
+    def load(cls, files: dict, metadata: str = default_metadata) -> 'Cube':
+        tables = {indicator: read_rows(filename) for indicator, filename in files.items()}
+        names = {}
+        for _, _, rows in tables.values():
+            for name, code, _ in rows:
+                names.setdefault(code, name)
+        index = {code: i for i, code in enumerate(names)}
+        times, values = {}, {}
+        for indicator, (indicator_times, _, rows) in tables.items():
+            layer = np.full((len(names), len(indicator_times)), np.nan)
+            for _, code, row_values in rows:
+                row_values = row_values[:len(indicator_times)]
+                layer[index[code], :len(row_values)] = row_values
+            # time axis spans only times with any value
+            filled = np.flatnonzero(~np.isnan(layer).all(axis=0))
+            times[indicator] = indicator_times[filled[0]:filled[-1] + 1]
+            values[indicator] = layer[:, filled[0]:filled[-1] + 1]
+        resolution = max((resolution for _, resolution, _ in tables.values()), key=resolutions.index)
+        if metadata and not os.path.exists(metadata):
+            raise FileNotFoundError(f'Wrong metadata: {metadata}')
+        metadata = read_metadata(metadata) if metadata else {}
+        return cls(list(names.values()), list(names), times, values, resolution, metadata)
+
+    def layer(self, indicator: str) -> np.ndarray:
+        if indicator not in self.indicators:
+            raise Exception(f'Wrong indicator: {indicator}')
+        return self.values[indicator]
+
+    # countries x times matrix of indicator, in given times nan where indicator has no value
+    def matrix(self, indicator: str, countries: list, times: np.ndarray = None) -> np.ndarray:
+        values = self.layer(indicator)[[self.rows[country] for country in countries]]
+        if times is None:
+            return values
+        own = self.times[indicator]
+        columns = np.clip(np.searchsorted(own, times), 0, len(own) - 1)
+        return np.where(own[columns] == times, values[:, columns], np.nan)
+
+    # value of every country in given time
+    def at(self, indicator: str, time: float) -> np.ndarray:
+        return self.matrix(indicator, self.names, np.array([time]))[:, 0]
+
+    # {country: {time: value}} of existing values (of countries in mask only), as parse_file returns them
+    def to_dict(self, indicator: str, mask: np.ndarray = None) -> dict:
+        layer = self.layer(indicator)
+        times = self.times[indicator].tolist()
+        rows = np.flatnonzero(mask) if mask is not None else range(len(self.names))
+        return {self.names[i]: {times[j]: value for j, value in enumerate(layer[i].tolist()) if value == value}
+                for i in rows}
+
+    # {country: code}
+    def shorts(self) -> dict:
+        return dict(zip(self.names, self.codes))
+
+    def label(self, time: float) -> str:
+        return time_label(time, self.resolution)
+
+    # group of every country, by metadata column (region, income) or by file with rows "code;group",
+    # '' for countries in no group
+    def group_keys(self, by: str) -> np.ndarray:
+        if by in self.meta:
+            return self.meta[by]
+        if not os.path.exists(by):
+            raise Exception(f'Wrong groups: {by}')
+        with open(by) as csvfile:
+            groups = {row[0]: row[1] for row in csv.reader(csvfile, delimiter=';') if row}
+        return np.array([groups.get(code, '') for code in self.codes], dtype=object)
+
+    # sum of indicator over member countries of every group (aggregate rows are never members),
+    # missing values of members count as 0, nan where no member has value
+    def group_sum(self, indicator: str, by: str) -> (list, np.ndarray):
+        keys = self.group_keys(by)
+        members = (keys != '') & ~self.aggregate
+        groups, inverse = np.unique(keys[members].astype(str), return_inverse=True)
+        if not len(groups):
+            raise Exception(f'Wrong groups: {by}')
+        # members sorted by group, so every group is sum of one slice of rows
+        order = np.argsort(inverse, kind='stable')
+        values = self.layer(indicator)[members][order]
+        starts = np.searchsorted(inverse[order], np.arange(len(groups)))
+        sums = np.add.reduceat(np.nan_to_num(values), starts, axis=0)
+        filled = np.add.reduceat(~np.isnan(values), starts, axis=0)
+        return list(groups), np.where(filled > 0, sums, np.nan)
+
+    # cube of groups instead of countries, with indicator summed over members, group takes code of the
+    # aggregate row of the same name (e.g. South Asia - SAS), its initials or first letters
+    def grouped(self, by: str, indicator: str = 'population') -> 'Cube':
+        groups, values = self.group_sum(indicator, by)
+        codes = {name: self.codes[i] for i, name in enumerate(self.names) if self.aggregate[i]}
+        shorts = [codes.get(group, ''.join(word[0] for word in group.split() if word[0].isalnum()).upper()
+                            if ' ' in group else group[:3].upper()) for group in groups]
+        return Cube(groups, shorts, {indicator: self.times[indicator]}, {indicator: values}, self.resolution)
+
+
+def add_arguments(parser):
+    parser.add_argument('-g', '--groups', type=str,
+                        help='sums of country groups instead of countries: region, income or file with rows "code;group"')
+    parser.add_argument('--metadata', type=str, default=default_metadata,
+                        help='countries metadata, rows "country;code;region;income;aggregate"')
+
+
+# indicators of countries or of their groups, as requested by arguments
+def load_indicators(files: dict, args) -> Cube:
+    indicators = Cube.load(files, args.metadata)
+    return indicators.grouped(args.groups) if args.groups else indicators
@@ -5,16 +5,22 @@ from cmath import sqrt
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from statsmodels.tsa.ar_model import AutoReg
-from statsmodels.tsa.arima_model import ARIMA as arima_mod, ARMA as arma_mod
-from statsmodels.tsa.holtwinters import ExponentialSmoothing as exp_mod
 import warnings
-from statsmodels.tools.sm_exceptions import ConvergenceWarning, HessianInversionWarning
-warnings.simplefilter('ignore', ConvergenceWarning)
-warnings.simplefilter('ignore', HessianInversionWarning)
+
+import profiling
+
+
+# statsmodels is imported only when a model is fitted
+def ignore_fit_warnings():
+    from statsmodels.tools.sm_exceptions import ConvergenceWarning, HessianInversionWarning
+    warnings.simplefilter('ignore', ConvergenceWarning)
+    warnings.simplefilter('ignore', HessianInversionWarning)
 
 
 def AR(cdf):
+    from statsmodels.tsa.ar_model import AutoReg
+    ignore_fit_warnings()
+
     country = cdf['Country'][0]
     data = cdf['AverageTemperatureCelsius'].to_list()
     model = AutoReg(data, lags=10)
@@ -29,6 +35,9 @@ def AR(cdf):
 
 
 def ExponentialSmoothing(cdf):
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing as exp_mod
+    ignore_fit_warnings()
+
     country = cdf['Country'][0]
     data = cdf['AverageTemperatureCelsius'].to_list()
     model = exp_mod(data)
@@ -43,6 +52,9 @@ def ExponentialSmoothing(cdf):
 
 
 def ARIMA(cdf):
+    from statsmodels.tsa.arima_model import ARIMA as arima_mod
+    ignore_fit_warnings()
+
     country = cdf['Country'][0]
     data = cdf['AverageTemperatureCelsius'].to_list()
     model = arima_mod(data, order=(5, 1, 0))
@@ -58,15 +70,25 @@ def ARIMA(cdf):
     return cdf
 
 
-def fit(cdf, select_model):
+# walk-forward validation over time series folds, only first n folds if given
+def fit(cdf, select_model, folds: int = None):
     from sklearn.model_selection import TimeSeriesSplit
     from sklearn.metrics import mean_squared_error
+    if select_model == 'ARIMA':
+        from statsmodels.tsa.arima_model import ARIMA as arima_mod
+    elif select_model == 'AR':
+        from statsmodels.tsa.ar_model import AutoReg
+    elif select_model == 'ES':
+        from statsmodels.tsa.holtwinters import ExponentialSmoothing as exp_mod
+    ignore_fit_warnings()
 
     X = cdf['AverageTemperatureCelsius'].values
 
     tscv = TimeSeriesSplit(n_splits=5)
     rmse = []
-    for train_index, test_index in tscv.split(X):
+    for fold, (train_index, test_index) in enumerate(tscv.split(X)):
+        if folds and fold >= folds:
+            break
         train, test = X[train_index], X[test_index]
         history = [x for x in train]
         predictions = list()
@@ -134,7 +156,8 @@ def reg(reg_func = None):
 
     for country in countries:
         cdf = gdf.groupby('Country').get_group(country)
-        plots(cdf, country, reg_func.__name__ if reg_func else 'avg')
+        with profiling.stage('plot', country=country):
+            plots(cdf, country, reg_func.__name__ if reg_func else 'avg')
     plt.close('all')
 
 
@@ -147,7 +170,8 @@ def mod_fit():
         for country in countries:
             cdf = gdf.groupby('Country').get_group(country)
             print(f'[{method}] {country}', end=': ')
-            fit(cdf, method)
+            with profiling.stage('fit', method=method, country=country):
+                fit(cdf, method)
 
 
 x_range = None
@@ -157,12 +181,14 @@ out = None
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-o', '--output', action='store_true', help='store')
+    profiling.add_arguments(parser)
     parsed_args = parser.parse_args()
     out = parsed_args.output if parsed_args.output else None
 
-    reg()
-    reg(AR)
-    reg(ExponentialSmoothing)
-    reg(ARIMA)
-    mod_fit()
+    with profiling.session(parsed_args):
+        for reg_func in [None, AR, ExponentialSmoothing, ARIMA]:
+            with profiling.stage(f'reg {reg_func.__name__ if reg_func else "avg"}'):
+                reg(reg_func)
+        with profiling.stage('mod_fit'):
+            mod_fit()
 
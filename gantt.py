@@ -1,129 +1,175 @@
 #!/usr/bin/env python3
-import datetime
+import argparse
 
+import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
-
-
-color = True
-
-
-class GTask(object):
-    def __init__(self, name, start, stop, tcolor='lightblue'):
-        self.name = name
-        self.start = datetime.datetime.strptime(start, "%d.%m.%Y").toordinal()
-        self.stop = datetime.datetime.strptime(stop, "%d.%m.%Y").toordinal()
-        self.barh = [(self.start, self.stop - self.start)]
-        self.color = tcolor
-
-
-def main():
+from matplotlib.collections import PolyCollection
+from matplotlib.colors import to_hex
+from matplotlib.ticker import Formatter, MaxNLocator
+
+power_rangers = {
+    'JN': 'red',
+    'MK': 'blue',
+    'JS': 'green',
+    'KD': 'black',
+    'ALL': 'purple'
+}
+
+# at most this many task names are labelled at once, more rows are labelled every n-th
+max_labels = 40
+# longer date ranges are too dense for a tick every week and grid line every day
+max_weekly_days = 120
+
+
+# return task names, owners and start/stop as arrays of matplotlib date numbers
+def load_tasks(filename: str) -> (np.ndarray, np.ndarray, np.ndarray, np.ndarray):
+    if filename.endswith('.json'):
+        tasks = pd.read_json(filename, dtype={'start': str, 'stop': str})
+    else:
+        tasks = pd.read_csv(filename, dtype=str)
+    starts = mdates.date2num(pd.to_datetime(tasks['start'], format='%d.%m.%Y').to_numpy())
+    stops = mdates.date2num(pd.to_datetime(tasks['stop'], format='%d.%m.%Y').to_numpy())
+    return tasks['name'].to_numpy(), tasks['owner'].to_numpy(), starts, stops
+
+
+# owners from power_rangers keep their colors, others get colors from tab10
+def owner_colors(owners: np.ndarray) -> (np.ndarray, np.ndarray):
+    codes, unique_owners = pd.factorize(owners)
+    cycle = [to_hex(c) for c in plt.get_cmap('tab10').colors]
+    others = iter(cycle[i % len(cycle)] for i in range(len(unique_owners)))
+    palette = np.array([power_rangers[owner] if owner in power_rangers else next(others)
+                        for owner in unique_owners], dtype=object)
+    return palette[codes], np.asarray(unique_owners)
+
+
+# every task is a rectangle (start, i - 0.4) - (stop, i + 0.4)
+def task_bars(starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+    rows = np.arange(len(starts))
+    verts = np.empty((len(starts), 4, 2))
+    verts[:, [0, 3], 0] = starts[:, None]
+    verts[:, [1, 2], 0] = stops[:, None]
+    verts[:, [0, 1], 1] = (rows - 0.4)[:, None]
+    verts[:, [2, 3], 1] = (rows + 0.4)[:, None]
+    return verts
+
+
+# task names as y tick labels, colored by owner
+class TaskLabels(Formatter):
+    def __init__(self, names: np.ndarray, colors: np.ndarray):
+        self.names = names
+        self.colors = colors
+
+    def row(self, y: float) -> int:
+        row = int(round(y))
+        return row if abs(y - row) < 1e-6 and 0 <= row < len(self.names) else -1
+
+    def __call__(self, y, pos=None):
+        row = self.row(y)
+        return self.names[row] if row >= 0 else ''
+
+    # only ticks in view are formatted, so only their labels are colored
+    def format_ticks(self, values):
+        for tick, value in zip(self.axis.get_major_ticks(len(values)), values):
+            row = self.row(value)
+            if row >= 0:
+                tick.label1.set_color(self.colors[row])
+        return [self(value, i) for i, value in enumerate(values)]
+
+
+# indices of tasks (from given ones) with bars in visible rows and dates
+def visible_tasks(indices: np.ndarray, starts: np.ndarray, stops: np.ndarray, xlim: tuple, ylim: tuple) -> np.ndarray:
+    first, last = np.searchsorted(indices, [min(ylim) - 0.5, max(ylim) + 0.5])
+    indices = indices[first:last]
+    return indices[(stops[indices] >= min(xlim)) & (starts[indices] <= max(xlim))]
+
+
+# weekly ticks with daily grid for plans of a few months, automatic date ticks when zoomed out
+def date_ticks(ax):
     from matplotlib.dates import WE
-    years = mdates.YearLocator()
-    months = mdates.MonthLocator()
-    days = mdates.DayLocator()
-    weekdays = mdates.WeekdayLocator(byweekday=WE)
-    years_fmt = mdates.DateFormatter('%Y')
-    months_fmt = mdates.DateFormatter('%m')
-    wd_fmt = mdates.DateFormatter('%d.%m')
-    days_fmt = mdates.DateFormatter('')
+    from matplotlib.ticker import NullFormatter, NullLocator
+    x0, x1 = ax.get_xlim()
+    if abs(x1 - x0) <= max_weekly_days:
+        ax.xaxis.set_major_locator(mdates.WeekdayLocator(byweekday=WE))
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%d.%m'))
+        ax.xaxis.set_minor_locator(mdates.DayLocator())
+        ax.xaxis.set_minor_formatter(NullFormatter())
+    else:
+        locator = mdates.AutoDateLocator()
+        ax.xaxis.set_major_locator(locator)
+        ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+        ax.xaxis.set_minor_locator(NullLocator())
+
+
+def main(args):
+    names, owners, starts, stops = load_tasks(args.tasks)
+    colors, unique_owners = owner_colors(owners)
+
     fig, ax = plt.subplots(figsize=(15, 8))
 
     # format the ticks
-    ax.xaxis.set_major_locator(weekdays)
-    ax.xaxis.set_major_formatter(wd_fmt)
-    ax.xaxis.set_minor_locator(days)
-    ax.xaxis.set_minor_formatter(days_fmt)
-
-    # round to nearest years.
-    datemin = datetime.date(day=1, month=4, year=2020)
-    datemax = datetime.date(day=27, month=5, year=2020)
-    ax.set_xlim(datemin, datemax)
+    ax.set_xlim(starts.min(), stops.max())
+    date_ticks(ax)
 
     # format the coords message box
     ax.format_xdata = mdates.DateFormatter('%d.%m.%Y')
-    ax.grid(b=True, which='major', linestyle='-')
-    ax.grid(b=True, which='minor', linestyle='-')
+    ax.grid(visible=True, which='major', linestyle='-')
+    ax.grid(visible=True, which='minor', linestyle='-')
     ax.set_axisbelow(True)
     ax.xaxis.set_tick_params(labelsize='large', width=4)
 
-    # red - JN
-    # green - JS
-    # blue - KD
-    # orange - MK
-
-    power_rangers = {
-        'JN': 'red',
-        'MK': 'blue',
-        'JS': 'green',
-        'KD': 'black',
-        'ALL': 'purple'
-    }
-
     import matplotlib.patches as mpatches
 
-    ax.legend(handles=[mpatches.Patch(color=power_rangers[user], label=user) for user in power_rangers])
-
-    tasks = [
-        GTask('Project', '01.04.2020', '20.05.2020', power_rangers['ALL']),
-        GTask('Project presentation', '20.05.2020', '27.05.2020', power_rangers['ALL']),
-        GTask('Preparing git repositories', '01.04.2020', '08.04.2020', power_rangers['ALL']),
-        GTask('Setting up IDE and environment', '01.04.2020', '08.04.2020', power_rangers['ALL']),
-
-        # JN
-        GTask('API between stages definition', '15.04.2020', '20.04.2020', power_rangers['JN']),
-        GTask('Preparing first version of README', '20.04.2020', '27.04.2020', power_rangers['JN']),
-        GTask('Code reviewing and merging pull requests', '20.04.2020', '14.05.2020', power_rangers['JN']),
-        GTask('Preparing final README', '27.04.2020', '20.05.2020', power_rangers['JN']),
-        GTask('Preparing integration tests', '27.04.2020', '20.05.2020', power_rangers['JN']),
-
-        # JS
-        GTask('Import bachelor project for downloading UniProt seqs', '15.04.2020', '20.04.2020', power_rangers['JS']),
-        GTask('Implementing efficient storing and getting UniProt seqs', '20.04.2020', '24.04.2020', power_rangers['JS']),
-        GTask('Preparing test input data and simple test cases', '24.04.2020', '27.04.2020', power_rangers['JS']),
-        GTask('Preparing complex tests for 1st step', '27.04.2020', '07.05.2020', power_rangers['JS']),
-        GTask('Integration with other steps', '27.04.2020', '14.05.2020', power_rangers['JS']),
-
-        # KD
-        GTask('Preparing input (with JS) and output (with MK) format definition', '20.04.2020', '24.04.2020', power_rangers['KD']),
-        GTask('Preparing test input data and simple test cases', '24.04.2020', '27.04.2020', power_rangers['KD']),
-        GTask('Preparing complex tests for 2nd step', '27.04.2020', '07.05.2020', power_rangers['KD']),
-        GTask('Implementing amino-acids analyzer', '27.04.2020', '07.05.2020', power_rangers['KD']),
-        GTask('Integration with other steps', '07.05.2020', '14.05.2020', power_rangers['KD']),
-
-        # MK
-        GTask('Preparing input (with KD) and output format definition', '20.04.2020', '24.04.2020', power_rangers['MK']),
-        GTask('Preparing test input data and simple test cases', '24.04.2020', '27.04.2020', power_rangers['MK']),
-        GTask('Preparing complex tests for 3rd step', '27.04.2020', '07.05.2020', power_rangers['MK']),
-        GTask('Implementing amino-acids analyzer\'s data visualization', '27.04.2020', '07.05.2020', power_rangers['MK']),
-        GTask('Integration with other steps', '07.05.2020', '14.05.2020', power_rangers['MK']),
-    ]
-
-    trans_color = {
-        'lightblue': '///',
-        'purple': '--',
-        'orange': '...',
-        'green': '',
-        'red': 'xxx',
-    }
-
-    labels = [task.name for task in tasks]
-    ax.set_yticks(range(len(labels)))
-    ax.set_yticklabels(labels)
-
-    my_colors = [task.color for task in tasks]
-
-    for tick_label, tick_color in zip(plt.gca().get_yticklabels(), my_colors):
-        tick_label.set_color(tick_color)
-
-    for i, task in enumerate(tasks):
-        if not color:
-            ax.broken_barh(task.barh, (i - 0.4, 0.8), color='white', edgecolor='black')
-        else:
-            ax.broken_barh(task.barh, (i - 0.4, 0.8), facecolor=task.color, edgecolor='black')
-
-    plt.show()
+    owner_color = dict(zip(owners, colors))
+    ax.legend(handles=[mpatches.Patch(color=owner_color[owner], label=owner) for owner in unique_owners])
+
+    ax.yaxis.set_major_locator(MaxNLocator(nbins=max_labels, integer=True, min_n_ticks=1))
+    ax.yaxis.set_major_formatter(TaskLabels(names, colors))
+
+    # bars are materialised only for tasks in view, bw bars are white
+    if args.color not in ('color', 'bw'):
+        raise Exception('Wrong color')
+    verts = task_bars(starts, stops)
+    collection = PolyCollection([], facecolors='white', edgecolors='black')
+    ax.add_collection(collection, autolim=False)
+
+    def update_view(_=None):
+        shown = visible_tasks(np.arange(len(names)), starts, stops, ax.get_xlim(), ax.get_ylim())
+        collection.set_verts(verts[shown])
+        if args.color == 'color':
+            collection.set_facecolor(list(colors[shown]))
+
+    def scroll(event):
+        y0, y1 = ax.get_ylim()
+        if event.inaxes is not ax or y1 - y0 >= len(names):
+            return
+        shift = -event.step * max(1, round((y1 - y0) / 10))
+        shift = min(max(shift, -0.5 - y0), len(names) - 0.5 - y1)
+        ax.set_ylim(y0 + shift, y1 + shift)
+        fig.canvas.draw_idle()
+
+    ax.callbacks.connect('xlim_changed', date_ticks)
+    ax.callbacks.connect('xlim_changed', update_view)
+    ax.callbacks.connect('ylim_changed', update_view)
+    fig.canvas.mpl_connect('scroll_event', scroll)
+    window = min(args.window, len(names)) if args.window else len(names)
+    ax.set_ylim(len(names) - window - 0.5, len(names) - 0.5)
+    update_view()
+
+    if args.output:
+        plt.savefig(args.output)
+    else:
+        plt.show()
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('tasks', type=str, nargs='?', help='tasks csv or json file (name, start, stop, owner)',
+                        default='data/gantt_tasks.csv')
+    parser.add_argument('-c', '--color', type=str, help='color: color, bw', default='color')
+    parser.add_argument('-o', '--output', type=str, help='output filename')
+    parser.add_argument('-w', '--window', type=int, help='number of rows in view, scroll to move, all by default')
+    parsed_args = parser.parse_args()
+
+    main(parsed_args)
@@ -1,26 +1,130 @@
 #!/usr/bin/env python3
 import argparse
+import io
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-from fpdf import FPDF
+from PIL import Image
+
+# A4 landscape page and image placement in mm
+page_w, page_h = 297, 210
+image_x, image_y, image_w, image_h = 20, 0, 240, 180
+image_extensions = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff')
+
+
+def mm_to_pt(mm: float) -> float:
+    return mm * 72 / 25.4
+
+
+# image downsampled to target dpi for its place on page and recompressed to jpeg, returns (width, height, jpeg)
+def prepare_image(filename: str, dpi: int, quality: int) -> (int, int, bytes):
+    with Image.open(filename) as image:
+        # last frame of animated gif shows its final state
+        if getattr(image, 'n_frames', 1) > 1:
+            image.seek(image.n_frames - 1)
+        image = image.convert('RGBA')
+    page_image = Image.new('RGB', image.size, 'white')
+    page_image.paste(image, mask=image.split()[3])
+
+    max_w, max_h = round(image_w / 25.4 * dpi), round(image_h / 25.4 * dpi)
+    if page_image.width > max_w or page_image.height > max_h:
+        page_image = page_image.resize((min(page_image.width, max_w), min(page_image.height, max_h)), Image.LANCZOS)
+
+    jpeg = io.BytesIO()
+    page_image.save(jpeg, 'JPEG', quality=quality, optimize=True)
+    return page_image.width, page_image.height, jpeg.getvalue()
+
+
+# minimal pdf writer, every page is written to file as soon as it is added,
+# used as context manager it removes the incomplete file when writing fails
+class PdfStream(object):
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.file = open(filename, 'wb')
+        self.offsets = {}
+        self.pages = []
+        # objects 1 (catalog) and 2 (pages) are written at the end, when all pages are known
+        self.next_id = 3
+        self.file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def write_object(self, obj_id: int, body: bytes, stream: bytes = None):
+        self.offsets[obj_id] = self.file.tell()
+        self.file.write(f'{obj_id} 0 obj\n'.encode() + body)
+        if stream is not None:
+            self.file.write(b'\nstream\n' + stream + b'\nendstream')
+        self.file.write(b'\nendobj\n')
+
+    def add_jpeg_page(self, width: int, height: int, jpeg: bytes):
+        image_id, content_id, page_id = self.next_id, self.next_id + 1, self.next_id + 2
+        self.next_id += 3
+
+        self.write_object(image_id, (f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} '
+                                     f'/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /DCTDecode '
+                                     f'/Length {len(jpeg)} >>').encode(), jpeg)
+        x, w, h = mm_to_pt(image_x), mm_to_pt(image_w), mm_to_pt(image_h)
+        y = mm_to_pt(page_h - image_y - image_h)
+        content = f'q {w:.2f} 0 0 {h:.2f} {x:.2f} {y:.2f} cm /I{image_id} Do Q'.encode()
+        self.write_object(content_id, f'<< /Length {len(content)} >>'.encode(), content)
+        self.write_object(page_id, (f'<< /Type /Page /Parent 2 0 R '
+                                    f'/MediaBox [0 0 {mm_to_pt(page_w):.2f} {mm_to_pt(page_h):.2f}] '
+                                    f'/Resources << /XObject << /I{image_id} {image_id} 0 R >> >> '
+                                    f'/Contents {content_id} 0 R >>').encode())
+        self.pages.append(page_id)
+
+    def close(self):
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self.pages)
+        self.write_object(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>'.encode())
+        self.write_object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+
+        xref_offset = self.file.tell()
+        self.file.write(f'xref\n0 {self.next_id}\n0000000000 65535 f \n'.encode())
+        for obj_id in range(1, self.next_id):
+            self.file.write(f'{self.offsets[obj_id]:010d} 00000 n \n'.encode())
+        self.file.write(f'trailer\n<< /Size {self.next_id} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'.encode())
+        self.file.close()
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
 
 
 def main(args):
     from os import listdir
     from os.path import isfile, join
     image_files = [f for f in listdir(args.directory) if isfile(join(args.directory, f))]
-    image_files = sorted(image_files)
+    image_files = sorted(f for f in image_files if f.lower().endswith(image_extensions))
 
-    pdf = FPDF('L', 'mm', 'A4')
-    for image in image_files:
-        pdf.add_page()
-        pdf.image(f'{args.directory}/{image}', x=20, y=0, w=240, h=180)
-    pdf.output(args.output, "F")
+    # at most 2 images per worker are prepared ahead, so memory does not grow with number of images
+    workers = args.jobs if args.jobs else os.cpu_count()
+    with PdfStream(args.output) as pdf, ProcessPoolExecutor(max_workers=workers) as executor:
+        window = 2 * workers
+        pending = deque()
+        for image in image_files:
+            pending.append(executor.submit(prepare_image, f'{args.directory}/{image}', args.dpi, args.quality))
+            if len(pending) >= window:
+                pdf.add_jpeg_page(*pending.popleft().result())
+        while pending:
+            pdf.add_jpeg_page(*pending.popleft().result())
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('directory', type=str, help='directory with images', default='images')
     parser.add_argument('-o', '--output', type=str, help='output pdf filename', required=True)
+    parser.add_argument('-d', '--dpi', type=int, help='max resolution of images in pdf', default=150)
+    parser.add_argument('-q', '--quality', type=int, help='jpeg quality of images in pdf', default=85)
+    parser.add_argument('-j', '--jobs', type=int, help='number of parallel workers, all cpus by default')
     parsed_args = parser.parse_args()
 
     main(parsed_args)
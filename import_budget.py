@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import subprocess
+import sys
+
+# command: (modules imported when running it, import time budget in seconds)
+budgets = {
+    'anim.py': (['anim'], 1.0),
+    'anim_select.py': (['anim_select'], 1.0),
+    'inter.py plotly': (['inter', 'plotly.express'], 1.0),
+    'inter.py bokeh': (['inter', 'bokeh.io', 'bokeh.models', 'bokeh.plotting'], 2.0),
+    'inter.py altair': (['inter', 'altair'], 1.5),
+    'spain_covid19.py unemployment/CPI': (['spain_covid19', 'plotly.express'], 1.0),
+    'spain_covid19.py communities_cases': (['spain_covid19', 'geopandas', 'matplotlib.pyplot',
+                                            'mpl_toolkits.axes_grid1'], 2.0),
+    'spain_covid19.py communities_interactive': (['spain_covid19', 'geopandas', 'bokeh.io', 'bokeh.models',
+                                                  'bokeh.plotting'], 2.0),
+    'forecast.py': (['forecast'], 1.5),
+    'temp.py': (['temp'], 1.0),
+    'gantt.py': (['gantt'], 1.0),
+    'images_to_pdf.py': (['images_to_pdf'], 0.5),
+    'merge_htmls.py': (['merge_htmls'], 0.5),
+}
+
+
+# import time of modules in a fresh interpreter, so nothing is cached in sys.modules
+def measure(modules: list) -> float:
+    code = f'import time; t = time.perf_counter(); import {", ".join(modules)}; print(time.perf_counter() - t)'
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main(args):
+    results = {}
+    for command, (modules, budget) in budgets.items():
+        if args.commands and not any(command.startswith(selected) for selected in args.commands):
+            continue
+        # best of repeats, first run also pays for cold disk cache
+        times = [measure(modules) for _ in range(args.repeat)]
+        results[command] = {'modules': modules, 'budget': budget, 'time': min(times), 'times': times}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for command, result in results.items():
+            status = 'OK' if result['time'] <= result['budget'] else 'OVER'
+            print(f'[{status}] {command}: {result["time"]:.3f}s (budget {result["budget"]:.1f}s)')
+
+    if any(result['time'] > result['budget'] for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('commands', type=str, nargs='*', help='check only commands starting with given names')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='number of measurements per command')
+    parser.add_argument('-j', '--json', action='store_true', help='print results as json')
+    parsed_args = parser.parse_args()
+
+    main(parsed_args)
@@ -1,29 +1,13 @@
 #!/usr/bin/env python3
 
 import argparse
-import csv
+import os
 
-import altair as alt
+import numpy as np
 import pandas as pd
-import plotly.express as px
-from bokeh.io import save
-from bokeh.models import ColumnDataSource, HoverTool
 
-start_year = 1960
-stop_year = 2018
-
-
-# return {country: {year: population}} + {country: {short name}}
-def parse_file(filename: str, data_type='int') -> (dict, dict):
-    countries = {}
-    shorts = {}
-    with open(filename) as csvfile:
-        spamreader = csv.reader(csvfile, delimiter=';')
-        for row in spamreader:
-            countries[row[0]] = {start_year + i - 2: int(row[i]) if data_type == 'int' else float(row[i]) for i in
-                                 range(2, len(row)) if row[i]}
-            shorts[row[0]] = row[1]
-    return countries, shorts
+import profiling
+import cube
 
 
 def pick_5_closest(country: str, data: dict, year: int):
@@ -52,6 +36,82 @@ def pick_5_closest(country: str, data: dict, year: int):
     return list(closest_5_sorted.keys())
 
 
+# long (Year, Population, Country) table from country x year matrix, year by year in countries order
+def long_format(data: dict, countries: list, years: np.ndarray) -> pd.DataFrame:
+    matrix = pd.DataFrame({cntry: data[cntry] for cntry in countries}).reindex(years)
+    df = matrix.rename_axis(index='Year', columns='Country').stack().dropna().rename('Population').reset_index()
+    return df[['Year', 'Population', 'Country']]
+
+
+# indices of at most threshold points keeping visual shape of series (largest triangle three buckets)
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    # first and last points are always kept, inner points are split into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    indices = np.empty(threshold, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x, next_y = x[stop:edges[i + 2]].mean(), y[stop:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        areas = np.abs((x[a] - next_x) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (next_y - y[a]))
+        a = start + int(np.argmax(areas))
+        indices[i + 1] = a
+    return indices
+
+
+# at most max_points rows per country, rows keep their original order
+def decimate(df: pd.DataFrame, max_points: int) -> pd.DataFrame:
+    keep = [
+        country_df.index[lttb(country_df['Year'].to_numpy(dtype=float), country_df['Population'].to_numpy(dtype=float), max_points)]
+        for _, country_df in df.groupby('Country', sort=False)
+    ]
+    return df.loc[np.sort(np.concatenate(keep))]
+
+
+# runtime file is written only once per library version, so every chart can reference it
+def write_asset(path: str, content: bytes):
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as asset_file:
+        asset_file.write(content)
+    os.replace(tmp_path, path)
+
+
+# url of asset relative to directory of output html file
+def asset_url(path: str, output: str) -> str:
+    return os.path.relpath(os.path.abspath(path), os.path.dirname(os.path.abspath(output))).replace(os.sep, '/')
+
+
+def plotly_asset(assets: str) -> str:
+    import plotly
+    from plotly.offline import get_plotlyjs
+
+    path = f'{assets}/plotly-{plotly.__version__}/plotly.min.js'
+    write_asset(path, get_plotlyjs().encode())
+    return path
+
+
+def bokeh_assets(assets: str) -> str:
+    import bokeh
+    from bokeh.util.paths import bokehjs_path
+
+    root = f'{assets}/bokeh-{bokeh.__version__}'
+    js_dir = os.path.join(bokehjs_path(), 'js')
+    for name in os.listdir(js_dir):
+        if name.endswith('.min.js'):
+            with open(os.path.join(js_dir, name), 'rb') as js_file:
+                write_asset(f'{root}/static/js/{name}', js_file.read())
+    return root
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('database', type=str)
@@ -60,90 +120,53 @@ def main():
     parser.add_argument('lib', type=str, help='mode', choices=['plotly', 'bokeh', 'altair'])
     parser.add_argument('plot', type=str, help='mode', choices=['scatter', 'line'])
     parser.add_argument('-o', '--output', type=str, help='output filename')
+    parser.add_argument('-l', '--large', action='store_true',
+                        help='large data: webgl rendering, altair data in separate file, decimated series')
+    parser.add_argument('-p', '--max-points', type=int, help='max points per country, 2000 in large mode')
+    parser.add_argument('-a', '--assets', type=str,
+                        help='directory for shared plotly/bokeh js runtime referenced by output instead of inlined')
+    cube.add_arguments(parser)
+    profiling.add_arguments(parser)
     args = parser.parse_args()
 
-    data, shorts = parse_file(args.database)
-    not_countries = [
-        'World',
-        'IDA & IBRD total',
-        'Low & middle income',
-        'Middle income',
-        'IBRD only',
-        'Upper middle income',
-        'Late-demographic dividend',
-        'East Asia & Pacific',
-        'Early-demographic dividend',
-        'Lower middle income',
-        'East Asia & Pacific (excluding high income)',
-        'East Asia & Pacific (IDA & IBRD countries)',
-        'OECD members',
-        'High income',
-        'Post-demographic dividend',
-        'Europe & Central Asia',
-
-        'South Asia',
-        'South Asia (IDA & IBRD)',
-        'European Union',
-        'IDA total',
-        'Europe & Central Asia (IDA & IBRD countries)',
-        'Europe & Central Asia (excluding high income)',
-        'Euro area',
-        'IDA only',
-        'Least developed countries: UN classification',
-        'Sub-Saharan Africa',
-
-        'Sub-Saharan Africa (IDA & IBRD countries)',
-        'Sub-Saharan Africa (excluding high income)',
-        'Latin America & Caribbean',
-        'Latin America & the Caribbean (IDA & IBRD countries)',
-        'Latin America & Caribbean (excluding high income)',
-        'North America',
-        'Pre-demographic dividend',
-
-        'Heavily indebted poor countries (HIPC)',
-        'Low income',
-        'IDA blend',
-        'Fragile and conflict affected situations',
-
-        'Middle East & North Africa',
-        'Middle East & North Africa (excluding high income)',
-        'Middle East & North Africa (IDA & IBRD countries)',
-
-        'Arab World',
-        'Central Europe and the Baltics',
+    with profiling.session(args):
+        interactive_chart(args)
 
-    ]
 
-    for ncount in not_countries:
-        if ncount in data:
-            del data[ncount]
-
-    closest_5_start = pick_5_closest(args.country, data, args.year)
-    countries_5_closest_data = {country: data[country] for country in closest_5_start}
-    closest_5_stop = pick_5_closest(args.country, countries_5_closest_data, stop_year)
-
-    x = []
-    y = []
-    cnt = []
-    for i in range(start_year, stop_year):
-        for cntry in closest_5_stop:
-            pop = data[cntry][i]
-            x.append(i)
-            y.append(pop)
-            cnt.append(cntry)
-    df = pd.DataFrame(dict(Year=x, Population=y, Country=cnt))
+def interactive_chart(args):
+    with profiling.stage('load'):
+        indicators = cube.load_indicators({'population': args.database}, args)
+        # aggregate rows (World, regions, income groups) are not countries
+        data, shorts = indicators.to_dict('population', ~indicators.aggregate), indicators.shorts()
+        years = indicators.times['population']
+
+    with profiling.stage('select'):
+        closest_5_start = pick_5_closest(args.country, data, args.year)
+        countries_5_closest_data = {country: data[country] for country in closest_5_start}
+        closest_5_stop = pick_5_closest(args.country, countries_5_closest_data, years[-1])
+
+    with profiling.stage('reshape'):
+        df = long_format(data, closest_5_stop, years)
+        max_points = args.max_points if args.max_points else 2000 if args.large else None
+        if max_points:
+            df = decimate(df, max_points)
 
     colormap = ['red', 'green', 'blue', 'orange', 'purple']
+    country_colors = {cntry: colormap[i % len(colormap)] for i, cntry in enumerate(closest_5_stop)}
 
-    title = f'Population in selected countries across years ({start_year} - {stop_year})'
+    title = f'Population in selected countries across years ({indicators.label(years[0])} - {indicators.label(years[-1])})'
     ax_x_title = 'Years'
     ax_y_title = 'Population'
 
     if args.lib == 'plotly':
+        with profiling.stage('import'):
+            import plotly.express as px
+
+        render_mode = 'webgl' if args.large else 'auto'
         if args.plot == 'scatter':
-            fig = px.scatter(df, x="Year", y="Population", color="Country")
+            fig = px.scatter(df, x="Year", y="Population", color="Country", render_mode=render_mode)
         elif args.plot == 'line':
-            fig = px.line(df, x="Year", y="Population", color="Country")
+            fig = px.line(df, x="Year", y="Population", color="Country", render_mode=render_mode)
         else:
             return
         fig.update_layout(
@@ -151,16 +174,20 @@ def main():
             xaxis_title=ax_x_title,
             yaxis_title=ax_y_title
         )
-        if args.output:
-            fig.write_html(args.output)
-        else:
-            fig.show()
+        with profiling.stage('write'):
+            if args.output and args.assets:
+                fig.write_html(args.output, include_plotlyjs=asset_url(plotly_asset(args.assets), args.output))
+            elif args.output:
+                fig.write_html(args.output)
+            else:
+                fig.show()
     elif args.lib == 'bokeh':
-        from bokeh.plotting import figure, output_file, show
+        with profiling.stage('import'):
+            from bokeh.io import save
+            from bokeh.models import ColumnDataSource, HoverTool
+            from bokeh.plotting import figure, output_file, show
 
-        colors = [colormap[closest_5_stop.index(country_name)] for country_name in cnt]
-
-        p = figure(title=title)
+        p = figure(title=title, output_backend='webgl' if args.large else 'canvas')
         p.xaxis.axis_label = ax_x_title
         p.yaxis.axis_label = ax_y_title
         hover_tool = HoverTool(
@@ -173,53 +200,69 @@ def main():
         p.add_tools(hover_tool)
 
         if args.plot == 'scatter':
-            source = ColumnDataSource(data=dict(
-                Year=x,
-                Population=y,
-                Country=cnt,
-                color=colors
-            ))
+            source = ColumnDataSource(df.assign(color=df['Country'].map(country_colors)))
             p.circle('Year', 'Population', source=source, fill_color='color', fill_alpha=0.2, size=10)
         elif args.plot == 'line':
-            for i, cntry in enumerate(closest_5_stop):
-                pop = data[cntry]
-                source = ColumnDataSource(data=dict(
-                    Year=[pop_key for pop_key in pop.keys()],
-                    Population=[pop_val for pop_val in pop.values()],
-                    Country=[cntry for _ in range(len(pop))]
-                ))
-                p.line('Year', 'Population', source=source, color=colormap[i])
+            # one multi line source with a row per country instead of source per country
+            countries = df.groupby('Country', sort=False)
+            source = ColumnDataSource(data=dict(
+                Year=[country_df['Year'].to_numpy() for _, country_df in countries],
+                Population=[country_df['Population'].to_numpy() for _, country_df in countries],
+                Country=list(countries.groups),
+                color=[country_colors[cntry] for cntry in countries.groups],
+            ))
+            p.multi_line('Year', 'Population', source=source, color='color')
         else:
             return
 
-        if args.output:
-            output_file(args.output, title=title)
-            save(p)
-        else:
-            show(p)
+        with profiling.stage('write'):
+            if args.output and args.assets:
+                from bokeh.resources import Resources
+
+                root_url = asset_url(bokeh_assets(args.assets), args.output)
+                output_file(args.output, title=title)
+                save(p, resources=Resources(mode='server', root_url=f'{root_url}/'))
+            elif args.output:
+                output_file(args.output, title=title)
+                save(p)
+            else:
+                show(p)
     elif args.lib == 'altair':
-        df['Year'] = pd.to_datetime(df['Year'], format='%Y')
+        with profiling.stage('import'):
+            import altair as alt
+
+        df['Year'] = pd.to_datetime(df['Year'].map(indicators.label))
+        source = df
+        if args.large and args.output:
+            # data is stored next to chart and loaded by url instead of being inlined into spec
+            data_file = f'{os.path.splitext(args.output)[0]}.json'
+            df.to_json(data_file, orient='records', date_format='iso')
+            source = alt.UrlData(os.path.basename(data_file), format=alt.DataFormat(type='json'))
+        elif args.large:
+            alt.data_transformers.disable_max_rows()
+
         if args.plot == 'scatter':
-            al = alt.Chart(df, title=title).mark_circle(size=60).encode(
-                x='Year',
-                y='Population',
-                color='Country',
-                tooltip=['Year', 'Population', 'Country'],
+            al = alt.Chart(source, title=title).mark_circle(size=60).encode(
+                x='Year:T',
+                y='Population:Q',
+                color='Country:N',
+                tooltip=['Year:T', 'Population:Q', 'Country:N'],
             )
         elif args.plot == 'line':
-            al = alt.Chart(df, title=title).mark_line(size=4).encode(
-                x='Year',
-                y='Population',
-                color='Country',
-                tooltip=['Year', 'Population', 'Country'],
+            al = alt.Chart(source, title=title).mark_line(size=4).encode(
+                x='Year:T',
+                y='Population:Q',
+                color='Country:N',
+                tooltip=['Year:T', 'Population:Q', 'Country:N'],
             )
         else:
             return
 
-        if args.output:
-            alt.Chart.save(al, args.output)
-        else:
-            alt.Chart.show(al)
+        with profiling.stage('write'):
+            if args.output:
+                alt.Chart.save(al, args.output)
+            else:
+                alt.Chart.show(al)
 
 
 if __name__ == '__main__':
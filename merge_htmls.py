@@ -1,13 +1,56 @@
 #!/usr/bin/env python3
 import argparse
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from collections import Counter
 
+script_re = re.compile(r'<script\b([^>]*)>(.*?)</script>', re.IGNORECASE | re.DOTALL)
+src_re = re.compile(r'\bsrc="([^"]+)"', re.IGNORECASE)
+style_re = re.compile(r'<style\b[^>]*>.*?</style>', re.IGNORECASE | re.DOTALL)
+head_re = re.compile(r'<head\b[^>]*>(.*?)</head>', re.IGNORECASE | re.DOTALL)
+body_re = re.compile(r'<body\b[^>]*>(.*?)</body>', re.IGNORECASE | re.DOTALL)
+id_re = re.compile(r'\bid="([^"]+)"')
+spec_url_re = re.compile(r'("url"\s*:\s*")([^"]+)(")')
 
-def main(args):
-    from os import listdir
-    from os.path import isfile, join
-    html_files = [f for f in listdir(args.directory) if isfile(join(args.directory, f))]
-    html_files = sorted(html_files)
-    html_files = [f'{args.directory}/{file}' for file in html_files if file.endswith('.html') or file.endswith('.gif') or file.endswith('.png')]
+# charts are kept in inert templates and rendered only when scrolled close to the viewport
+lazy_charts_js = '''<script>
+(function() {
+  function render(chart) {
+    var template = chart.querySelector('template');
+    var content = template.content.cloneNode(true);
+    // scripts cloned from template are inert, so they are recreated to run
+    content.querySelectorAll('script').forEach(function(old) {
+      var script = document.createElement('script');
+      Array.from(old.attributes).forEach(function(attr) { script.setAttribute(attr.name, attr.value); });
+      script.text = old.text;
+      old.replaceWith(script);
+    });
+    template.remove();
+    chart.appendChild(content);
+  }
+  var charts = document.querySelectorAll('.chart');
+  if (!('IntersectionObserver' in window)) {
+    charts.forEach(render);
+    return;
+  }
+  var observer = new IntersectionObserver(function(entries) {
+    entries.forEach(function(entry) {
+      if (entry.isIntersecting) {
+        observer.unobserve(entry.target);
+        render(entry.target);
+      }
+    });
+  }, {rootMargin: '200px'});
+  charts.forEach(function(chart) { observer.observe(chart); });
+})();
+</script>
+'''
+
+
+def merge_iframes(html_files: list, output: str):
     html = ''
     for filename in html_files:
         if filename.endswith('.html'):
@@ -16,14 +59,132 @@ def main(args):
             html += f'<div style="text-align: center;"><p align="center"><img src="{filename}" width="90%" height="auto"></img></p></div>\n'
     html += ''
 
-    with open(args.output, 'w') as final:
+    with open(output, 'w') as final:
         final.write(html)
 
 
+# url relative to chart file converted to url relative to report file
+def rebase_url(url: str, chart_file: str, output: str) -> str:
+    if re.match(r'^([a-z][a-z0-9+.-]*:|/)', url, re.IGNORECASE):
+        return url
+    path = os.path.join(os.path.dirname(os.path.abspath(chart_file)), url)
+    return os.path.relpath(path, os.path.dirname(os.path.abspath(output))).replace(os.sep, '/')
+
+
+# urls in vega-lite spec (data of altair chart saved with -l) are resolved against page, not chart file
+def rebase_spec_urls(script: str, chart_file: str, output: str) -> str:
+    if 'vegaEmbed' not in script:
+        return script
+    return spec_url_re.sub(lambda match: f'{match.group(1)}{rebase_url(match.group(2), chart_file, output)}'
+                                         f'{match.group(3)}', script)
+
+
+# ids used by an earlier chart (e.g. altair's "vis") are renamed, so charts on one page do not collide,
+# only id attributes, getElementById calls and #id selectors (css, querySelector, vegaEmbed) are changed
+def rename_ids(html: str, ids: set, suffix: str) -> str:
+    for chart_id in ids:
+        renamed = f'{chart_id}-{suffix}'
+        name = re.escape(chart_id)
+        html = re.sub(rf'(\bid\s*=\s*(["\'])){name}(?=\2)', lambda match: f'{match.group(1)}{renamed}', html)
+        html = re.sub(rf'(\bgetElementById\(\s*(["\'])){name}(?=\2)', lambda match: f'{match.group(1)}{renamed}', html)
+        html = re.sub(rf'(?<![\w&#]){re.escape("#" + chart_id)}(?![\w-])', f'#{renamed}', html)
+    return html
+
+
+# head and body of chart file
+def chart_parts(filename: str) -> (str, str):
+    with open(filename) as chart_file:
+        chart = chart_file.read()
+    head = head_re.search(chart)
+    body = body_re.search(chart)
+    return head.group(1) if head else '', body.group(1) if body else chart
+
+
+def content_hash(script: str) -> str:
+    return hashlib.sha1(script.encode()).hexdigest()
+
+
+# inline scripts present in more than one chart, runtimes of charts built without shared assets (plotly.js, bokehjs)
+def shared_inline_scripts(html_files: list) -> set:
+    counts = Counter()
+    for filename in html_files:
+        if filename.endswith('.html'):
+            head, body = chart_parts(filename)
+            counts.update({content_hash(match.group(0)) for match in script_re.finditer(head + body)
+                           if not src_re.search(match.group(1))})
+    return {digest for digest, count in counts.items() if count > 1}
+
+
+def merge_document(html_files: list, output: str):
+    shared = shared_inline_scripts(html_files)
+    # runtimes (scripts with src, inline scripts of heads and shared inline scripts) in order of first use,
+    # they are written once at the end of body, before charts are rendered
+    runtimes = {}
+    styles = {}
+    ids = set()
+    # charts are streamed into temporary file, styles found in them are written to head before it
+    with tempfile.TemporaryFile('w+') as charts:
+        for i, filename in enumerate(html_files):
+            url = rebase_url(os.path.basename(filename), filename, output)
+            if filename.endswith('.gif') or filename.endswith('.png'):
+                charts.write(f'<div style="text-align: center;"><p align="center">'
+                             f'<img src="{url}" width="90%" height="auto" loading="lazy"></p></div>\n')
+                continue
+
+            head, body = chart_parts(filename)
+
+            def runtime(match, in_head: bool = False) -> str:
+                src = src_re.search(match.group(1))
+                if src:
+                    src = rebase_url(src.group(1), filename, output)
+                    runtimes.setdefault(src, f'<script type="text/javascript" src="{src}"></script>')
+                    return ''
+                digest = content_hash(match.group(0))
+                if in_head or digest in shared:
+                    runtimes.setdefault(digest, match.group(0))
+                    return ''
+                return rebase_spec_urls(match.group(0), filename, output)
+
+            # runtimes are taken out before ids are renamed, so their code is never changed
+            head = script_re.sub(lambda match: runtime(match, True), head)
+            body = script_re.sub(runtime, body)
+            taken_ids = set(id_re.findall(body)) & ids
+            head, body = rename_ids(head, taken_ids, str(i)), rename_ids(body, taken_ids, str(i))
+            ids |= set(id_re.findall(body))
+
+            for style in style_re.findall(head):
+                styles.setdefault(content_hash(style), style)
+            charts.write(f'<div class="chart" data-source="{url}"><template>{body}</template></div>\n')
+
+        with open(output, 'w') as final:
+            final.write('<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n'
+                        '<style>.chart { min-height: 400px; margin: 0 auto 20px; width: 80%; }</style>\n')
+            for style in styles.values():
+                final.write(f'{style}\n')
+            final.write('</head>\n<body>\n')
+            charts.seek(0)
+            shutil.copyfileobj(charts, final)
+            for script in runtimes.values():
+                final.write(f'{script}\n')
+            final.write(lazy_charts_js)
+            final.write('</body>\n</html>\n')
+
+
+def main(args):
+    html_files = [f for f in os.listdir(args.directory) if os.path.isfile(os.path.join(args.directory, f))]
+    html_files = sorted(html_files)
+    html_files = [f'{args.directory}/{file}' for file in html_files if file.endswith('.html') or file.endswith('.gif') or file.endswith('.png')]
+    if args.iframes:
+        merge_iframes(html_files, args.output)
+    else:
+        merge_document(html_files, args.output)
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('directory', type=str, help='directory with images', default='images')
     parser.add_argument('-o', '--output', type=str, help='output pdf filename', required=True)
+    parser.add_argument('-i', '--iframes', action='store_true', help='embed every html chart in separate iframe')
     parsed_args = parser.parse_args()
 
     main(parsed_args)
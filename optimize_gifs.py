@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+import raster
+
+# last palette index is transparent, it marks pixels unchanged since previous frame
+transparent = 255
+# when all frames have more colors than palette, this many most common ones are still exact
+exact_colors = 64
+
+
+# every frame as displayed (previous frames composed under it) in rgb, with its duration in ms
+def read_frames(filename: str):
+    with Image.open(filename) as gif:
+        for i in range(getattr(gif, 'n_frames', 1)):
+            gif.seek(i)
+            yield np.asarray(gif.convert('RGB')), gif.info.get('duration', 100)
+
+
+def rgb_keys(frame: np.ndarray) -> np.ndarray:
+    frame = frame.astype(np.uint32)
+    return frame[..., 0] << 16 | frame[..., 1] << 8 | frame[..., 2]
+
+
+def key_colors(keys: np.ndarray) -> np.ndarray:
+    return np.stack([keys >> 16, keys >> 8 & 255, keys & 255], axis=1).astype(np.uint8)
+
+
+# colors of all frames, or median cut palette of sample of all frames when there are too many of them
+def global_palette(filename: str) -> np.ndarray:
+    colors = np.zeros(0, dtype=np.uint32)
+    sample = []
+    for frame, _ in read_frames(filename):
+        colors = np.union1d(colors, rgb_keys(frame))
+        sample.append(frame[::4, ::4])
+    if len(colors) <= transparent:
+        return key_colors(colors)
+    # most common colors (background, bars, text) are kept exactly, the rest is approximated
+    sample = np.concatenate(sample)
+    keys, counts = np.unique(rgb_keys(sample), return_counts=True)
+    common = key_colors(keys[np.argsort(counts)[::-1][:exact_colors]])
+    quantized = Image.fromarray(sample).quantize(transparent - exact_colors, dither=Image.NONE)
+    approximated = np.array(quantized.getpalette()[:3 * (transparent - exact_colors)], dtype=np.uint8).reshape(-1, 3)
+    return np.concatenate([common, approximated])
+
+
+# palette indices of frame colors, exact ones or the nearest ones
+def frame_indices(frame: np.ndarray, palette: np.ndarray) -> np.ndarray:
+    keys = rgb_keys(frame)
+    colors, inverse = np.unique(keys, return_inverse=True)
+    colors = key_colors(colors).astype(np.int32)
+    distances = ((colors[:, None, :] - palette[None, :, :].astype(np.int32)) ** 2).sum(axis=2)
+    return distances.argmin(axis=1).astype(np.uint8)[inverse].reshape(keys.shape)
+
+
+# lzw compressed image data (minimum code size and data sub-blocks) of indices, as pillow writes them
+def lzw_data(indices: np.ndarray, palette: bytes) -> (bytes, int):
+    image = Image.fromarray(indices)
+    image.putpalette(palette)
+    _, _, data, interlace = raster.gif_image(image)
+    return data, interlace
+
+
+# gif with shared global palette, every frame is only rectangle changed since previous one,
+# where unchanged pixels are transparent, duplicate frames are merged into previous one
+def write_optimized(filename: str, output: str):
+    palette = global_palette(filename)
+    palette_bytes = np.concatenate([palette, np.repeat(palette[:1], 256 - len(palette), axis=0)]).tobytes()
+    with Image.open(filename) as gif:
+        width, height = gif.size
+        loop = gif.info.get('loop')
+
+    frames = []
+    previous = None
+    for frame, duration in read_frames(filename):
+        indices = frame_indices(frame, palette)
+        if previous is None:
+            frames.append([0, 0, width, height, indices, duration, False])
+        else:
+            changed = indices != previous
+            if not changed.any():
+                frames[-1][5] += duration
+                continue
+            rows, cols = np.flatnonzero(changed.any(axis=1)), np.flatnonzero(changed.any(axis=0))
+            y0, y1, x0, x1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+            delta = np.where(changed[y0:y1, x0:x1], indices[y0:y1, x0:x1], transparent).astype(np.uint8)
+            frames.append([x0, y0, x1 - x0, y1 - y0, delta, duration, True])
+        previous = indices
+        # previous frame is complete with its duration, so it can be encoded and dropped
+        if len(frames) > 1:
+            frames[-2][4] = lzw_data(frames[-2][4], palette_bytes)
+
+    frames[-1][4] = lzw_data(frames[-1][4], palette_bytes)
+    with open(output, 'wb') as out:
+        # global color table with 256 colors
+        out.write(b'GIF89a' + struct.pack('<HHBBB', width, height, 0xf7, 0, 0) + palette_bytes)
+        if loop is not None:
+            out.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', loop) + b'\x00')
+        for x, y, w, h, (data, interlace), duration, delta in frames:
+            # graphic control: do not dispose, delay in 1/100 s, transparent index of delta frames
+            out.write(b'\x21\xf9\x04' + bytes([4 | delta]) + struct.pack('<H', round(duration / 10)) +
+                      bytes([transparent]) + b'\x00')
+            out.write(b'\x2c' + struct.pack('<HHHHB', x, y, w, h, interlace) + data)
+        out.write(b'\x3b')
+
+
+# gif is replaced only if optimized one is smaller
+def optimize_gif(filename: str) -> (int, int):
+    output = f'{filename}.tmp'
+    try:
+        write_optimized(filename, output)
+        size, optimized_size = os.path.getsize(filename), os.path.getsize(output)
+        if optimized_size < size:
+            os.replace(output, filename)
+        return size, min(size, optimized_size)
+    finally:
+        if os.path.exists(output):
+            os.remove(output)
+
+
+def main(args):
+    gifs = sorted(os.path.join(directory, name) for directory in args.directories
+                  for name in os.listdir(directory) if name.lower().endswith('.gif'))
+    sizes = []
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        for gif, (size, optimized_size) in zip(gifs, executor.map(optimize_gif, gifs)):
+            print(f'[+] {gif}: {size / 2 ** 20:.2f} MiB -> {optimized_size / 2 ** 20:.2f} MiB')
+            sizes.append((size, optimized_size))
+    if sizes:
+        size, optimized_size = map(sum, zip(*sizes))
+        print(f'[+] Total: {size / 2 ** 20:.2f} MiB -> {optimized_size / 2 ** 20:.2f} MiB')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rewrite gifs in place with frame differences and shared palette')
+    parser.add_argument('directories', type=str, nargs='+', help='directories with gifs, e.g. barh line pie')
+    parser.add_argument('-j', '--jobs', type=int, help='number of parallel workers, all cpus by default')
+    args = parser.parse_args()
+    main(args)
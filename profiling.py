@@ -0,0 +1,137 @@
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+
+# records wall and cpu time of pipeline stages and animation frames, written when session ends
+class Profiler(object):
+    def __init__(self, filename: str, trace_format: str = 'json'):
+        self.filename = filename
+        self.trace_format = trace_format
+        self.stages = []
+        self.frames = []
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+
+    def clock(self) -> (float, float):
+        return time.perf_counter() - self.wall_start, time.process_time() - self.cpu_start
+
+    def event(self, name: str, wall: float, cpu: float, wall_end: float, cpu_end: float, **details) -> dict:
+        return {'name': name, 'start': wall, 'wall': wall_end - wall, 'cpu': cpu_end - cpu, 'rss': peak_rss(),
+                **details}
+
+    def chrome_trace(self) -> dict:
+        events = [{
+            'name': event['name'], 'cat': category, 'ph': 'X', 'pid': os.getpid(), 'tid': 0,
+            'ts': round(event['start'] * 1e6), 'dur': round(event['wall'] * 1e6),
+            'args': {k: v for k, v in event.items() if k not in ('name', 'start', 'wall')},
+        } for category, events in (('stage', self.stages), ('frame', self.frames)) for event in events]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def report(self) -> dict:
+        wall, cpu = self.clock()
+        return {
+            'argv': sys.argv,
+            'wall': wall,
+            'cpu': cpu,
+            'peak_rss': peak_rss(),
+            'stages': self.stages,
+            'frames': self.frames,
+            'slowest_frames': sorted(self.frames, key=lambda frame: frame['wall'], reverse=True)[:10],
+        }
+
+    def save(self):
+        with open(self.filename, 'w') as trace:
+            json.dump(self.chrome_trace() if self.trace_format == 'chrome' else self.report(), trace, indent=1)
+
+
+_profiler = None
+_cprofile = None
+
+
+# peak resident memory of this process in bytes
+def peak_rss() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def add_arguments(parser):
+    parser.add_argument('--profile', type=str, help='write per stage and per frame timings to given json file')
+    parser.add_argument('--profile-format', type=str, choices=['json', 'chrome'], default='json',
+                        help='profile format, chrome trace can be opened in chrome://tracing or perfetto')
+    parser.add_argument('--cprofile', type=str, help='write cProfile stats to given file')
+
+
+# profiling is active inside session only if requested by arguments, otherwise stages and frames cost nothing
+@contextmanager
+def session(args):
+    global _profiler, _cprofile
+    if getattr(args, 'profile', None):
+        _profiler = Profiler(args.profile, args.profile_format)
+    if getattr(args, 'cprofile', None):
+        import cProfile
+        _cprofile = cProfile.Profile()
+        _cprofile.enable()
+    try:
+        yield
+    finally:
+        if _cprofile:
+            _cprofile.disable()
+            _cprofile.dump_stats(args.cprofile)
+            _cprofile = None
+        if _profiler:
+            _profiler.save()
+            _profiler = None
+
+
+@contextmanager
+def stage(name: str, **details):
+    if not _profiler:
+        yield
+        return
+    wall, cpu = _profiler.clock()
+    try:
+        yield
+    finally:
+        _profiler.stages.append(_profiler.event(name, wall, cpu, *_profiler.clock(), **details))
+
+
+# wraps animation function, so every frame is recorded with its index
+def frames(animate):
+    if not _profiler:
+        return animate
+
+    @wraps(animate)
+    def timed(i, *args):
+        profiler = _profiler
+        if not profiler:
+            return animate(i, *args)
+        wall, cpu = profiler.clock()
+        try:
+            return animate(i, *args)
+        finally:
+            index = len(profiler.frames)
+            profiler.frames.append(profiler.event(f'frame {index}', wall, cpu, *profiler.clock(), index=index,
+                                                  frame=repr(i)))
+    return timed
+
+
+# canvas drawing after animation function, recorded as part of the frame it draws
+@contextmanager
+def draw():
+    profiler = _profiler
+    if not profiler or not profiler.frames:
+        yield
+        return
+    wall, cpu = profiler.clock()
+    try:
+        yield
+    finally:
+        wall_end, cpu_end = profiler.clock()
+        frame = profiler.frames[-1]
+        frame.update(wall=wall_end - frame['start'], cpu=frame['cpu'] + cpu_end - cpu, rss=peak_rss(),
+                     draw=wall_end - wall, draw_cpu=cpu_end - cpu)
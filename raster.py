@@ -0,0 +1,211 @@
+import io
+import struct
+import subprocess
+from itertools import chain
+
+import numpy as np
+
+import profiling
+
+# at most this many rendered frames wait for encoder, so memory does not grow with number of frames
+queue_depth = 8
+# preview renders are smaller and have only every n-th frame, layout stays the same
+preview_dpi = 40
+preview_step = 4
+
+
+def agg_canvas(fig):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    if not isinstance(fig.canvas, FigureCanvasAgg):
+        FigureCanvasAgg(fig)
+    return fig.canvas
+
+
+# static layer of figure (everything except given artists) rendered once,
+# every frame is its copy with only the dynamic artists drawn over it
+class Background(object):
+    def __init__(self, fig, artists: list):
+        self.fig = fig
+        self.artists = sorted(artists, key=lambda artist: artist.get_zorder())
+        # animated artists are skipped by full draw
+        for artist in self.artists:
+            artist.set_animated(True)
+        agg_canvas(fig).draw()
+        self.background = fig.canvas.copy_from_bbox(fig.bbox)
+
+    # rgba pixels of current frame, valid until next call
+    def frame(self) -> np.ndarray:
+        self.fig.canvas.restore_region(self.background)
+        for artist in self.artists:
+            self.fig.draw_artist(artist)
+        return np.asarray(self.fig.canvas.buffer_rgba())
+
+
+# color table (and its size bits), lzw compressed data (minimum code size and data sub-blocks) and interlace flag
+# of palette image, as pillow writes it in a single frame gif
+def gif_image(image) -> (bytes, int, bytes, int):
+    encoded = io.BytesIO()
+    image.save(encoded, 'GIF', optimize=False, interlace=False)
+    gif = encoded.getvalue()
+
+    table, size_bits = b'', 0
+    if gif[10] & 0x80:
+        size_bits = gif[10] & 7
+        table = gif[13:13 + (3 << size_bits + 1)]
+    pos = 13 + len(table)
+    # extensions
+    while gif[pos] == 0x21:
+        pos += 2
+        while gif[pos]:
+            pos += gif[pos] + 1
+        pos += 1
+    # image descriptor and its local color table
+    flags = gif[pos + 9]
+    pos += 10
+    if flags & 0x80:
+        size_bits = flags & 7
+        table = gif[pos:pos + (3 << size_bits + 1)]
+        pos += len(table)
+    start = pos
+    pos += 1
+    while gif[pos]:
+        pos += gif[pos] + 1
+    return table, size_bits, gif[start:pos + 1], flags & 0x40
+
+
+# gif written frame by frame, every frame is only rectangle changed since previous one with its own color table,
+# frames same as previous one make it longer, so only the previous frame is kept in memory
+def write_pillow_gif(frames, filename: str, width: int, height: int, interval: float, fast: bool = False):
+    from PIL import Image
+    # fast encoding maps colors to fixed web palette instead of computing palette of every frame
+    quantize = {'palette': Image.WEB, 'dither': Image.NONE} if fast else {'palette': Image.ADAPTIVE}
+
+    def write_frame(out, box, duration, encoded):
+        x0, y0, x1, y1 = box
+        table, size_bits, data, interlace = encoded
+        # graphic control: do not dispose, delay in 1/100 s
+        out.write(b'\x21\xf9\x04\x04' + struct.pack('<H', round(duration / 10)) + b'\x00\x00')
+        out.write(b'\x2c' + struct.pack('<HHHHB', x0, y0, x1 - x0, y1 - y0, 0x80 | interlace | size_bits) + table + data)
+
+    with open(filename, 'wb') as out:
+        out.write(b'GIF89a' + struct.pack('<HHBBB', width, height, 0, 0, 0))
+        out.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', 0) + b'\x00')
+        previous, pending = None, None
+        for frame in frames:
+            rgb = frame[..., :3]
+            if previous is None:
+                box = (0, 0, width, height)
+            else:
+                changed = (rgb != previous).any(axis=2)
+                if not changed.any():
+                    pending[1] += interval
+                    continue
+                rows, cols = np.flatnonzero(changed.any(axis=1)), np.flatnonzero(changed.any(axis=0))
+                box = (cols[0], rows[0], cols[-1] + 1, rows[-1] + 1)
+            previous = np.array(rgb)
+            # frame is quantized and compressed as it comes, written when its duration is known
+            image = Image.fromarray(np.ascontiguousarray(rgb[box[1]:box[3], box[0]:box[2]])).convert('P', **quantize)
+            if pending:
+                write_frame(out, *pending)
+            pending = [box, interval, gif_image(image)]
+        write_frame(out, *pending)
+        out.write(b'\x3b')
+
+
+# rgba frames written to gif by imagemagick, by pillow when imagemagick is not installed,
+# both take frames one by one, so memory does not grow with number of frames
+def write_gif(frames, filename: str, interval: float, fast: bool = False):
+    from matplotlib.animation import ImageMagickWriter, writers
+    frames = iter(frames)
+    first = next(frames)
+    height, width = first.shape[:2]
+    if writers.is_available('imagemagick') and not fast:
+        command = [ImageMagickWriter.bin_path(), '-size', f'{width}x{height}', '-depth', '8',
+                   '-delay', str(interval / 10), '-loop', '0', 'rgba:-', filename]
+        with subprocess.Popen(command, stdin=subprocess.PIPE) as process:
+            for frame in chain([first], frames):
+                process.stdin.write(frame.tobytes())
+            process.stdin.close()
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, command)
+    else:
+        write_pillow_gif(chain([first], frames), filename, width, height, interval, fast)
+
+
+def _encode(frames_queue, filename: str, interval: float, fast: bool):
+    def frames():
+        frame = frames_queue.get()
+        while frame is not None:
+            yield frame
+            frame = frames_queue.get()
+    write_gif(frames(), filename, interval, fast)
+
+
+# frames rendered in this process are encoded in another one at the same time
+def save_frames(frames, filename: str, interval: float, fast: bool = False):
+    import multiprocessing
+    from queue import Full
+    frames_queue = multiprocessing.Queue(maxsize=queue_depth)
+    encoder = multiprocessing.Process(target=_encode, args=(frames_queue, filename, interval, fast))
+    encoder.start()
+
+    # waits while queue is full, unless encoder has failed
+    def put(item):
+        while True:
+            try:
+                frames_queue.put(item, timeout=1)
+                return
+            except Full:
+                if not encoder.is_alive():
+                    raise Exception(f'Encoding of {filename} failed')
+    failed = True
+    try:
+        for frame in frames:
+            # frame is a view of canvas, which is redrawn before the queue sends it
+            put(frame.copy())
+        put(None)
+        encoder.join()
+        failed = encoder.exitcode != 0
+    finally:
+        if encoder.is_alive():
+            encoder.terminate()
+        if failed:
+            # frames nobody will read would keep the queue's feeder thread (and exit) waiting forever
+            frames_queue.cancel_join_thread()
+            frames_queue.close()
+    if failed:
+        raise Exception(f'Encoding of {filename} failed')
+
+
+# animation whose frame function returns the artists it changes saved without full redraw of every frame
+def save_gif(fig, animate, frames, filename: str, interval: float, dpi: float = None, fast: bool = False):
+    frames = range(frames) if isinstance(frames, int) else frames
+    if dpi:
+        fig.set_dpi(dpi)
+    background = Background(fig, animate(frames[0]))
+
+    def render():
+        for i in frames:
+            animate(i)
+            with profiling.draw():
+                pixels = background.frame()
+            yield pixels
+    save_frames(render(), filename, interval, fast)
+
+
+# any animation (frames as in FuncAnimation, number or frame values) redrawn whole in every frame
+def save_animation(fig, animate, frames, filename: str, interval: float, dpi: float = None, init=None,
+                   fast: bool = False):
+    canvas = agg_canvas(fig)
+    if dpi:
+        fig.set_dpi(dpi)
+    if init:
+        init()
+
+    def render():
+        for frame in range(frames) if isinstance(frames, int) else frames:
+            animate(frame)
+            with profiling.draw():
+                canvas.draw()
+            yield np.asarray(canvas.buffer_rgba())
+    save_frames(render(), filename, interval, fast)
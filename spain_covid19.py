@@ -1,40 +1,96 @@
 #!/usr/bin/env python3
 
+import argparse
+import hashlib
 import json
 import math
-from typing import List
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
 
-import bokeh
 import pandas as pd
-import geopandas as gpd
-import matplotlib.pyplot as plt
-import datetime
-import plotly.graph_objects as go
-
-from bokeh.io import save
-from bokeh.models import HoverTool, PrintfTickFormatter, Tabs, Panel
-from matplotlib.animation import FuncAnimation
-from mpl_toolkits.axes_grid1 import make_axes_locatable
-import matplotlib.colors as colors
-import matplotlib.cm as cm
+import numpy as np
 
-modes = ['cases', 'death', 'hosp', 'recovered']
+import profiling
+import raster
 
-day_min = '2020-02-21'
-day_b4_max = '2020-05-18'
-day_max = '2020-05-19'
+# plotting backends (bokeh, geopandas, matplotlib, plotly) are imported only by functions using them
 
-start = datetime.datetime.strptime(day_min, "%Y-%m-%d")
-end = datetime.datetime.strptime(day_max, "%Y-%m-%d")
-date_array = [(start + datetime.timedelta(days=x)).strftime("%Y-%m-%d") for x in range(0, (end - start).days)]
+modes = ['cases', 'death', 'hosp', 'recovered']
 
-days = {
-    'cases': {'start': '2020-02-21', 'stop': '2020-05-18'},
-    'death': {'start': '2020-03-04', 'stop': '2020-05-18'},
-    'hosp': {'start': '2020-02-21', 'stop': '2020-05-18'},
-    'recovered': {'start': '2020-03-09', 'stop': '2020-05-18'},
+spain = {
+    'name': 'spain',
+    'title': 'Spain COVID-19',
+    'output_dir': 'spain_plots',
+    'key': 'cod_ine',
+    'key_type': 'int',
+    'label': 'CCAA',
+    'window': {'start': '2020-02-21', 'stop': '2020-05-19'},
+    'bounds': {'x': [-10, 5], 'y': [35, 44]},
+    'files': {
+        'cases': 'covid/ccaa_covid19_casos.csv',
+        'death': 'covid/ccaa_covid19_fallecidos.csv',
+        'hosp': 'covid/ccaa_covid19_hospitalizados.csv',
+        'recovered': 'covid/ccaa_covid19_altas.csv',
+    },
+    'population': {'file': 'covid/population.csv', 'column': 'Population'},
+    'geometry': {
+        'file': 'covid/spain-communities.geojson',
+        'key': 'cartodb_id',
+        # geometry key -> data key
+        'map': {
+            1: 1,
+            2: 2,
+            3: 4,
+            4: 5,
+            5: 6,
+            6: 8,
+            7: 7,
+            8: 9,
+            9: 18,
+            10: 11,
+            11: 12,
+            12: 17,
+            13: 13,
+            14: 19,
+            15: 14,
+            16: 15,
+            17: 16,
+            18: 3,
+            19: 10,
+        },
+    },
 }
 
+
+def load_spec(filename: str) -> dict:
+    with open(filename) as spec_file:
+        return json.load(spec_file)
+
+
+# same dataset rendered as fast preview (lower dpi, every few days, simplified borders) into separate files
+def preview_spec(spec: dict) -> dict:
+    return {**spec, 'name': f'{spec["name"]}_preview', 'preview': True}
+
+
+# every date in [start, stop) of dataset window as 'YYYY-MM-DD'
+def dataset_dates(spec: dict) -> List[str]:
+    window = pd.date_range(spec['window']['start'], spec['window']['stop'], freq='D', inclusive='left')
+    return list(window.strftime('%Y-%m-%d'))
+
+
+# dates shown in animation frames, in preview only every n-th and last one
+def frame_dates(spec: dict) -> List[str]:
+    dates = dataset_dates(spec)
+    return dates[:-1:raster.preview_step] + dates[-1:] if spec.get('preview') else dates
+
+
+day_min = spain['window']['start']
+day_max = spain['window']['stop']
+date_array = dataset_dates(spain)
+day_b4_max = date_array[-1]
+
 colormaps = {
     'cases': 'Reds',
     'death': 'Greys',
@@ -42,13 +98,6 @@ colormaps = {
     'recovered': 'Greens',
 }
 
-files = {
-    'cases': 'covid/ccaa_covid19_casos.csv',
-    'death': 'covid/ccaa_covid19_fallecidos.csv',
-    'hosp': 'covid/ccaa_covid19_hospitalizados.csv',
-    'recovered': 'covid/ccaa_covid19_altas.csv',
-}
-
 what = {
     'cases': 'Cases',
     'death': 'Deaths',
@@ -58,108 +107,151 @@ what = {
 
 order = 0
 
+# borders of preview maps are simplified with this tolerance (in degrees)
+preview_simplify = 0.05
+
+# {(dataset name, mode or 'geometry'): loaded dataframe}
+_datasets = {}
+
+
+def load_geometry(spec: dict):
+    cache_key = (spec['name'], 'geometry')
+    if cache_key not in _datasets:
+        import geopandas as gpd
+
+        geometry = spec['geometry']
+        geometry_df = gpd.read_file(geometry['file'])
+        # json specs always have string keys, so map on string representation
+        id_map = {str(k): v for k, v in geometry['map'].items()}
+        geometry_df[spec['key']] = geometry_df[geometry['key']].astype(str).map(id_map).astype(spec['key_type'])
+        if spec.get('preview'):
+            geometry_df['geometry'] = geometry_df.geometry.simplify(preview_simplify)
+        _datasets[cache_key] = geometry_df
+    return _datasets[cache_key]
+
+
+def load_mode(spec: dict, mode: str) -> pd.DataFrame:
+    cache_key = (spec['name'], mode)
+    if cache_key not in _datasets:
+        key, label = spec['key'], spec['label']
+        population = spec['population']
+        dates = dataset_dates(spec)
+
+        data_df = pd.read_csv(spec['files'][mode], dtype={key: spec['key_type'], label: str})
+        values = data_df.drop(columns=[key, label]).astype(float)
+        values.columns = pd.to_datetime(values.columns)
+        # dates missing inside data are carried from previous day, before first day are 0
+        values = values.reindex(columns=pd.to_datetime(dates)).ffill(axis=1).fillna(0)
+        values.columns = dates
+
+        population_df = pd.read_csv(population['file'], dtype={key: spec['key_type']})
+        map_df = data_df[[key, label]].merge(population_df, on=key)
+        values = values.loc[data_df[key].isin(map_df[key])].reset_index(drop=True)
+        per = values.div(map_df[population['column']].to_numpy(), axis=0) * 100
+        per.columns = [f'{date}_per' for date in dates]
+        _datasets[cache_key] = pd.concat([map_df, values, per], axis=1)
+    return _datasets[cache_key]
+
+
+def prepare_dfs(modes: List[str], spec: dict = spain):
+    map_dfs = {mode: load_mode(spec, mode) for mode in modes}
+    return map_dfs, load_geometry(spec)
+
+
+def prepare_df_for_day(modes: List[str], day: str, spec: dict = spain):
+    data_dfs, map_df = prepare_dfs(modes, spec)
+    columns = [spec['key'], spec['label'], day, f'{day}_per', spec['population']['column']]
+    new_dfs = {mode: map_df.merge(data_dfs[mode][columns], on=spec['key']) for mode in modes}
+    return new_dfs
 
-def prepare_dfs(modes: List[str]):
-    communities_df = gpd.read_file('covid/spain-communities.geojson')
-    id_map = {
-        1: 1,
-        2: 2,
-        3: 4,
-        4: 5,
-        5: 6,
-        6: 8,
-        7: 7,
-        8: 9,
-        9: 18,
-        10: 11,
-        11: 12,
-        12: 17,
-        13: 13,
-        14: 19,
-        15: 14,
-        16: 15,
-        17: 16,
-        18: 3,
-        19: 10,
-    }
-
-    communities_df['cod_ine'] = communities_df['cartodb_id'].map(id_map)
-    population_df = pd.read_csv('covid/population.csv')
-
-    data_dfs = {mode: pd.read_csv(files[mode]).fillna(value=0) for mode in modes}
-    map_dfs = {mode: data_dfs[mode].merge(population_df, on='cod_ine') for mode in modes}
 
+def prepare_df_for_all(modes: List[str], spec: dict = spain):
+    data_dfs, map_df = prepare_dfs(modes, spec)
+    map_dfs = {}
     for mode in modes:
-        day0 = days[mode]['start']
-        last_day = days[mode]['stop']
-
-        first_col = map_dfs[mode][day0]
-        last_col = map_dfs[mode][last_day]
-
-        # interpolation if data not exists
-        for date in date_array:
-            if date not in map_dfs[mode]:
-                if date < '2020-04-15':  # interpolate data before
-                    map_dfs[mode][date] = 0
-                else:  # interpolate data after
-                    map_dfs[mode][date] = last_col
-            map_dfs[mode][f'{date}_per'] = (map_dfs[mode][date] / map_dfs[mode]['Population']) * 100
-    return map_dfs, communities_df
-
-
-def prepare_df_for_day(modes: List[str], day: str):
-    data_dfs, map_df = prepare_dfs(modes)
-    new_dfs = {mode: map_df.merge(data_dfs[mode][['cod_ine', 'CCAA', day, f'{day}_per', 'Population']], on='cod_ine') for mode in modes}
-    return new_dfs
+        cache_key = (spec['name'], mode, 'joined')
+        if cache_key not in _datasets:
+            _datasets[cache_key] = map_df.merge(data_dfs[mode], on=spec['key'])
+        map_dfs[mode] = _datasets[cache_key]
+    return map_dfs
 
 
-def prepare_df_for_all(modes: List[str]):
-    data_dfs, map_df = prepare_dfs(modes)
-    map_dfs = {mode: map_df.merge(data_dfs[mode], on='cod_ine') for mode in modes}
-    return map_dfs
+# regions present in every mode with their geometry, serialised to geojson only once
+def interactive_geometry(modes: List[str], spec: dict = spain) -> Tuple[list, dict]:
+    data_dfs, geometry_df = prepare_dfs(modes, spec)
+    key, label, population = spec['key'], spec['label'], spec['population']['column']
+    regions = data_dfs[modes[0]][[key, label, population]]
+    for mode in modes[1:]:
+        regions = regions[regions[key].isin(data_dfs[mode][key])]
+    regions_df = geometry_df[[key, 'geometry']].merge(regions, on=key)
+    return regions_df[key].tolist(), json.loads(regions_df.to_json())
+
+
+# prebuilt geometry filled with '{mode}_{day}' and '{mode}_{day}_per' values of every mode
+def interactive_day_geojson(modes: List[str], day: str, geometry: Tuple[list, dict], spec: dict = spain) -> dict:
+    keys, geojson = geometry
+    data_dfs, _ = prepare_dfs(modes, spec)
+    values = {}
+    for mode in modes:
+        mode_df = data_dfs[mode].set_index(spec['key']).loc[keys]
+        values[f'{mode}_{day}'] = mode_df[day].tolist()
+        values[f'{mode}_{day}_per'] = mode_df[f'{day}_per'].tolist()
+
+    features = [
+        {**feature, 'properties': {**feature['properties'], **{field: column[i] for field, column in values.items()}}}
+        for i, feature in enumerate(geojson['features'])
+    ]
+    return {**geojson, 'features': features}
 
 
-def communities_interactive(modes: List[str], i_date_str: str, save_file: bool = False):
-    from bokeh.io import show, output_file
+def communities_interactive(modes: List[str], i_date_str: str, save_file: bool = False, spec: dict = spain,
+                            geometry: Optional[Tuple[list, dict]] = None, filename: str = None):
+    from bokeh.io import show, output_file, save
     from bokeh.plotting import figure
-    from bokeh.models import GeoJSONDataSource, LinearColorMapper, ColorBar
+    from bokeh.models import GeoJSONDataSource, LinearColorMapper, ColorBar, HoverTool, PrintfTickFormatter, Tabs, TabPanel
     from bokeh.palettes import brewer
-    i_date_str_per = f'{i_date_str}_per'
-    map_dfs = prepare_df_for_day(modes, i_date_str)
+    if not geometry:
+        geometry = interactive_geometry(modes, spec)
+    day_geojson = interactive_day_geojson(modes, i_date_str, geometry, spec)
+    x_range, y_range = tuple(spec['bounds']['x']), tuple(spec['bounds']['y'])
 
-    # Input GeoJSON source that contains features for plotting.
-    geosources = {mode: GeoJSONDataSource(geojson=map_dfs[mode].to_json()) for mode in modes}
+    # Input GeoJSON source that contains features for plotting, shared by all modes.
+    geosource = GeoJSONDataSource(geojson=json.dumps(day_geojson))
 
     tabs_arr = {}
     for mode in modes:
+        field = f'{mode}_{i_date_str}'
+        field_per = f'{field}_per'
+        day_values = [feature['properties'][field] for feature in day_geojson['features']]
+        day_values_per = [feature['properties'][field_per] for feature in day_geojson['features']]
         # Define color palette.
         palette = brewer[colormaps[mode]][8]
         # Reverse color order so that dark blue is highest.
         palette = palette[::-1]
         # Instantiate LinearColorMapper that linearly maps numbers in a range, into a sequence of colors.
-        max_cnt = map_dfs[mode][i_date_str].max()
-        min_cnt = map_dfs[mode][i_date_str].min()
+        max_cnt = max(day_values)
+        min_cnt = min(day_values)
 
-        max_per = map_dfs[mode][i_date_str_per].max()
-        min_per = map_dfs[mode][i_date_str_per].min()
+        max_per = max(day_values_per)
+        min_per = min(day_values_per)
         color_mapper_cnt = LinearColorMapper(palette=palette, low=min_cnt, high=max_cnt)
         color_mapper_per = LinearColorMapper(palette=palette, low=min_per, high=max_per)
         # Create color bar.
         color_bar_cnt = ColorBar(color_mapper=color_mapper_cnt, label_standoff=10, border_line_color=None, location=(0, 0))
         color_bar_per = ColorBar(color_mapper=color_mapper_per, label_standoff=10, border_line_color=None, location=(0, 0), formatter=PrintfTickFormatter(format="%0.2f%%"))
-        title = f'Spain COVID-19 {what[mode]}, {i_date_str}'
+        title = f'{spec["title"]} {what[mode]}, {i_date_str}'
 
         # Create figure object.
-        p_con_cnt = figure(title=title, plot_height=600, plot_width=950, toolbar_location=None, x_range=(-10, 5), y_range=(35, 44))
-        p_con_per = figure(title=title, plot_height=600, plot_width=950, toolbar_location=None, x_range=(-10, 5), y_range=(35, 44))
+        p_con_cnt = figure(title=title, height=600, width=950, toolbar_location=None, x_range=x_range, y_range=y_range)
+        p_con_per = figure(title=title, height=600, width=950, toolbar_location=None, x_range=x_range, y_range=y_range)
         ps = [p_con_cnt, p_con_per]
 
         hover_tool = HoverTool(
             tooltips=[
-                ("Community", "@CCAA"),
-                ("Population", f"@Population"),
-                (what[mode], f"@{{{i_date_str}}}"),
-                (f"% {what[mode]}", f"@{{{i_date_str_per}}}{{0.2f}}%")
+                ("Community", f"@{spec['label']}"),
+                ("Population", f"@{spec['population']['column']}"),
+                (what[mode], f"@{{{field}}}"),
+                (f"% {what[mode]}", f"@{{{field_per}}}{{0.2f}}%")
             ]
         )
 
@@ -174,35 +266,113 @@ def communities_interactive(modes: List[str], i_date_str: str, save_file: bool =
             p.yaxis.major_label_text_font_size = '0pt'  # turn off y-axis tick labels
             p.add_tools(hover_tool)
 
-        p_con_cnt.patches('xs', 'ys', source=geosources[mode], fill_color={'field': i_date_str, 'transform': color_mapper_cnt},
+        p_con_cnt.patches('xs', 'ys', source=geosource, fill_color={'field': field, 'transform': color_mapper_cnt},
                   line_color='black', line_width=0.25, fill_alpha=1)
-        p_con_per.patches('xs', 'ys', source=geosources[mode], fill_color={'field': i_date_str_per, 'transform': color_mapper_per},
+        p_con_per.patches('xs', 'ys', source=geosource, fill_color={'field': field_per, 'transform': color_mapper_per},
                   line_color='black', line_width=0.25, fill_alpha=1)
 
         p_con_cnt.add_layout(color_bar_cnt, 'right')
         p_con_per.add_layout(color_bar_per, 'right')
 
         tabs_arr[mode] = [
-            Panel(child=p_con_cnt, title=f'{what[mode]}'),
-            Panel(child=p_con_per, title=f'% {what[mode]}'),
+            TabPanel(child=p_con_cnt, title=f'{what[mode]}'),
+            TabPanel(child=p_con_per, title=f'% {what[mode]}'),
         ]
 
     # Display figure.
     tabs = Tabs(tabs=[tab for tabs in tabs_arr.values() for tab in tabs])
-    if save_file:
+    if save_file and filename:
+        output_file(filename)
+        save(tabs)
+    elif save_file:
         global order
-        output_file(f'spain_plots/{order}_spain_com_interactive_{i_date_str}.html')
+        output_file(f'{spec["output_dir"]}/{order}_{spec["name"]}_com_interactive_{i_date_str}.html')
         order += 1
         save(tabs)
     else:
         show(tabs)
 
 
-def communities_cases(modes: List[str], save_file: bool = False, lognorm: bool = False):
-    map_dfs = prepare_df_for_all(modes)
+def interactive_filename(day: str, spec: dict = spain) -> str:
+    return f'{spec["output_dir"]}/interactive/{spec["name"]}_com_interactive_{day}.html'
 
-    n = 2
-    fig, axs = plt.subplots(2, 2, figsize=(15, 8))
+
+# {snapshot filename: stamp it was rendered with}
+def interactive_stamps_filename(spec: dict = spain) -> str:
+    return f'{spec["output_dir"]}/interactive/{spec["name"]}_com_interactive.json'
+
+
+def load_interactive_stamps(spec: dict = spain) -> dict:
+    filename = interactive_stamps_filename(spec)
+    if not os.path.exists(filename):
+        return {}
+    with open(filename) as stamps_file:
+        return json.load(stamps_file)
+
+
+# hash of this script, modes and dataset spec the snapshots are rendered with
+def interactive_stamp(modes: List[str], spec: dict = spain) -> str:
+    digest = hashlib.sha256()
+    with open(os.path.abspath(__file__), 'rb') as script:
+        digest.update(script.read())
+    digest.update(json.dumps({'modes': modes, 'spec': spec}, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+# output is up to date when it was rendered by the same script with the same modes and spec
+# and it is newer than every input file of dataset
+def interactive_up_to_date(filename: str, modes: List[str], spec: dict = spain, stamps: dict = None) -> bool:
+    if not os.path.exists(filename):
+        return False
+    stamps = stamps if stamps is not None else load_interactive_stamps(spec)
+    if stamps.get(filename) != interactive_stamp(modes, spec):
+        return False
+    inputs = [spec['files'][mode] for mode in modes] + [spec['geometry']['file'], spec['population']['file']]
+    return os.path.getmtime(filename) >= max(os.path.getmtime(path) for path in inputs)
+
+
+_interactive_worker = {}
+
+
+def _init_interactive_worker(modes: List[str], spec: dict):
+    # every worker loads dataset and builds geometry once, then reuses it for all its days
+    _interactive_worker['modes'] = modes
+    _interactive_worker['spec'] = spec
+    _interactive_worker['geometry'] = interactive_geometry(modes, spec)
+
+
+def _interactive_day(day: str) -> str:
+    modes, spec = _interactive_worker['modes'], _interactive_worker['spec']
+    filename = interactive_filename(day, spec)
+    communities_interactive(modes, day, True, spec, geometry=_interactive_worker['geometry'], filename=filename)
+    return filename
+
+
+def communities_interactive_all(modes: List[str], days: List[str] = None, spec: dict = spain,
+                                workers: int = None, force: bool = False) -> List[str]:
+    days = days if days else frame_dates(spec)
+    os.makedirs(f'{spec["output_dir"]}/interactive', exist_ok=True)
+    stamps = load_interactive_stamps(spec)
+    if not force:
+        days = [day for day in days if not interactive_up_to_date(interactive_filename(day, spec), modes, spec, stamps)]
+    if not days:
+        return []
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_interactive_worker,
+                             initargs=(modes, spec)) as executor:
+        filenames = list(executor.map(_interactive_day, days))
+    stamp = interactive_stamp(modes, spec)
+    stamps.update({filename: stamp for filename in filenames})
+    with open(interactive_stamps_filename(spec), 'w') as stamps_file:
+        json.dump(stamps, stamps_file, indent=1, sort_keys=True)
+    return filenames
+
+
+# normalization of colors of every mode over all dates
+def communities_normalizes(map_dfs: dict, modes: List[str], lognorm: bool = False, spec: dict = spain) -> dict:
+    import matplotlib.colors as colors
+
+    date_array = dataset_dates(spec)
     normalizes = {}
     for mode in modes:
         max_cnt = map_dfs[mode][date_array].values.max(1).max()
@@ -210,13 +380,24 @@ def communities_cases(modes: List[str], save_file: bool = False, lognorm: bool =
         normalize = colors.Normalize(min_cnt, max_cnt) if not lognorm else colors.LogNorm(0.01, max_cnt)
 
         normalizes[mode] = normalize
+    return normalizes
+
+
+# 2x2 figure with a colorbar next to every mode's map
+def communities_figure(modes: List[str], normalizes: dict, spec: dict = spain, dpi: int = None):
+    import matplotlib.pyplot as plt
+    import matplotlib.cm as cm
+    from mpl_toolkits.axes_grid1 import make_axes_locatable
+
+    n = 2
+    fig, axs = plt.subplots(2, 2, figsize=(15, 8), dpi=dpi)
 
     def init():
         for i, mode in enumerate(modes):
             ax = axs[math.floor(i / n), i % n]
             ax.clear()
-            ax.set_xlim([-10, 5])
-            ax.set_ylim([35, 44])
+            ax.set_xlim(spec['bounds']['x'])
+            ax.set_ylim(spec['bounds']['y'])
 
             ax.set_xticks([])
             ax.set_yticks([])
@@ -224,45 +405,160 @@ def communities_cases(modes: List[str], save_file: bool = False, lognorm: bool =
             divider = make_axes_locatable(ax)
             cax = divider.append_axes('right', size='5%', pad=0.05)
             scalar_mappaple = cm.ScalarMappable(norm=normalizes[mode], cmap=colormaps[mode])
-            scalar_mappaple.set_array(max_cnt)
+            scalar_mappaple.set_array(normalizes[mode].vmax)
             fig.colorbar(scalar_mappaple, cax=cax)
         return axs
+    return fig, axs, init
+
 
+# draws i-th frame with maps of drawn modes only (all by default), the other axes get only their title and the same
+# aspect and axis labels as drawn maps, first frame has all maps, as layout of figure is computed from it
+def communities_frame(fig, axs, i: int, modes: List[str], map_dfs: dict, normalizes: dict, spec: dict = spain,
+                      drawn: List[str] = None):
+    n = 2
+    frame_array = frame_dates(spec)
+    # stop for 20 frames after all dates
+    if i >= len(frame_array):
+        i_date_str = frame_array[-1]
+    else:
+        i_date_str = frame_array[i % len(frame_array)]
+
+    drawn = modes if drawn is None or i == 0 else drawn
+    aspect, xlabel, ylabel = 'auto', None, None
+    for k, mode in enumerate(modes):
+        ax = axs[math.floor(k / n), k % n]
+        ax.clear()
+
+        ax.set_title(f'{spec["title"]} {what[mode].lower()}, {i_date_str}', pad=20, fontsize=20)
+        ax.set_xticks([])
+        ax.set_yticks([])
+        ax.set_xlim(spec['bounds']['x'])
+        ax.set_ylim(spec['bounds']['y'])
+        if mode in drawn:
+            map_dfs[mode].plot(column=i_date_str, norm=normalizes[mode], cmap=colormaps[mode], edgecolor='k', ax=ax)
+            aspect, xlabel, ylabel = ax.get_aspect(), ax.xaxis.label, ax.yaxis.label
+    for k, mode in enumerate(modes):
+        if mode not in drawn:
+            ax = axs[math.floor(k / n), k % n]
+            ax.set_aspect(aspect)
+            if xlabel is not None:
+                ax.set_xlabel(xlabel.get_text(), fontsize=xlabel.get_fontsize())
+                ax.set_ylabel(ylabel.get_text(), fontsize=ylabel.get_fontsize())
+    if i == 0:
+        fig.tight_layout()
+    return axs
+
+
+def communities_panel(mode: str, modes: List[str], normalizes: dict, frames_dir: str, dpi: int = 120,
+                      spec: dict = spain) -> Tuple[List[str], tuple]:
+    # render whole figure with only one mode's map for every frame date into separate png files,
+    # returns their paths and pixel rows and columns of the map in them
+    import matplotlib.pyplot as plt
+
+    plt.switch_backend('agg')
+    map_dfs = prepare_df_for_all(modes, spec)
+    fig, axs, init = communities_figure(modes, normalizes, spec, dpi)
+    init()
+
+    paths = []
+    for i in range(len(frame_dates(spec))):
+        communities_frame(fig, axs, i, modes, map_dfs, normalizes, spec, [mode])
+        path = os.path.join(frames_dir, f'{mode}_{i:04d}.png')
+        fig.savefig(path, dpi=dpi)
+        paths.append(path)
+    k = modes.index(mode)
+    box = axs[math.floor(k / 2), k % 2].get_window_extent()
+    height = fig.bbox.height
+    rows = slice(int(height - box.y1), int(np.ceil(height - box.y0)))
+    columns = slice(int(box.x0), int(np.ceil(box.x1)))
+    plt.close(fig)
+    return paths, (rows, columns)
+
+
+def communities_cases_parallel(modes: List[str], save_file: bool = False, lognorm: bool = False, dpi: int = 120,
+                               spec: dict = spain):
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+
+    with profiling.stage('prepare', modes=modes):
+        normalizes = communities_normalizes(prepare_df_for_all(modes, spec), modes, lognorm, spec)
+    date_array = frame_dates(spec)
+    step = raster.preview_step if spec.get('preview') else 1
     normalization = '(norm)' if not lognorm else '(lognorm)'
-    def animate(i):
-        # stop for 20 frames after all dates
-        if i >= len(date_array):
-            i_date_str = date_array[-1]
+    with tempfile.TemporaryDirectory() as frames_dir:
+        # every mode's map is rendered in its own process into the same figure layout,
+        # titles and colorbars are the same in all of them
+        with profiling.stage('panels', modes=modes), ProcessPoolExecutor(max_workers=len(modes)) as executor:
+            futures = {mode: executor.submit(communities_panel, mode, modes, normalizes, frames_dir, dpi, spec)
+                       for mode in modes}
+            panels = {mode: futures[mode].result() for mode in modes}
+
+        frame_h, frame_w = plt.imread(panels[modes[0]][0][0]).shape[:2]
+
+        def composite(i):
+            # stop for 20 frames after all dates
+            i = min(i, len(date_array) - 1)
+            frame = plt.imread(panels[modes[0]][0][i])
+            for mode in modes[1:]:
+                paths, box = panels[mode]
+                frame[box] = plt.imread(paths[i])[box]
+            return frame
+
+        # frames are pasted pixel by pixel, without resampling
+        fig = plt.figure(figsize=(frame_w / dpi, frame_h / dpi), dpi=dpi)
+        image = fig.figimage(composite(0), origin='upper')
+
+        def animate(i):
+            image.set_data(composite(i))
+            return image,
+
+        if save_file:
+            global order
+            # frames are encoded in another process while next ones are composed
+            with profiling.stage('save'):
+                raster.save_animation(fig, profiling.frames(animate), len(date_array) + 40 // step,
+                                      f'{spec["output_dir"]}/{order}_{spec["name"]}_com_anim_{normalization}.gif',
+                                      100 * step, dpi=dpi, fast=spec.get('preview', False))
+            order += 1
         else:
-            i_date_str = date_array[i % len(date_array)]
+            anim = FuncAnimation(fig, profiling.frames(animate), frames=len(date_array) + 40 // step, interval=100 * step,
+                                 blit=False)
+            plt.show()
 
-        for k, mode in enumerate(modes):
-            ax = axs[math.floor(k / n), k % n]
-            ax.clear()
 
-            titles = {
-                'cases': f'Spain COVID-19 cases, {i_date_str}',
-                'death': f'Spain COVID-19 deaths, {i_date_str}',
-                'hosp': f'Spain COVID-19 hospitalized, {i_date_str}',
-                'recovered': f'Spain COVID-19 recovered, {i_date_str}',
-            }
+def communities_cases(modes: List[str], save_file: bool = False, lognorm: bool = False, parallel: bool = False,
+                      spec: dict = spain):
+    # preview has every n-th date shown n times longer, so it has the same pace
+    step = raster.preview_step if spec.get('preview') else 1
+    dpi = raster.preview_dpi if spec.get('preview') else 120
+    if parallel:
+        return communities_cases_parallel(modes, save_file, lognorm, dpi, spec=spec)
 
-            ax.set_title(titles[mode], pad=20, fontsize=20)
-            ax.set_xticks([])
-            ax.set_yticks([])
-            ax.set_xlim([-10, 5])
-            ax.set_ylim([35, 44])
-            map_dfs[mode].plot(column=i_date_str, norm=normalizes[mode], cmap=colormaps[mode], edgecolor='k', ax=ax)
-        if i == 0:
-            fig.tight_layout()
-        return axs
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+
+    with profiling.stage('prepare', modes=modes):
+        map_dfs = prepare_df_for_all(modes, spec)
+        normalizes = communities_normalizes(map_dfs, modes, lognorm, spec)
+    frame_array = frame_dates(spec)
+
+    fig, axs, init = communities_figure(modes, normalizes, spec)
+    normalization = '(norm)' if not lognorm else '(lognorm)'
+
+    def animate(i):
+        return communities_frame(fig, axs, i, modes, map_dfs, normalizes, spec)
 
-    anim = FuncAnimation(fig, animate, init_func=init, frames=len(date_array) + 40, interval=100, blit=False)
     if save_file:
         global order
-        anim.save(f'spain_plots/{order}_spain_com_anim_{normalization}.gif', writer='imagemagick', dpi=120)
+        # frames are encoded in another process while next ones are rendered
+        with profiling.stage('save'):
+            raster.save_animation(fig, profiling.frames(animate), len(frame_array) + 40 // step,
+                                  f'{spec["output_dir"]}/{order}_{spec["name"]}_com_anim_{normalization}.gif',
+                                  100 * step, dpi=dpi, init=init, fast=spec.get('preview', False))
         order += 1
     else:
+        anim = FuncAnimation(fig, profiling.frames(animate), init_func=init, frames=len(frame_array) + 40 // step,
+                             interval=100 * step, blit=False)
         plt.show()
 
 
@@ -303,9 +599,45 @@ def CPI(save_file: bool = False):
 
 
 if __name__ == '__main__':
-    communities_cases(['cases', 'death', 'hosp', 'recovered'], True, False)
-    communities_cases(['cases', 'death', 'hosp', 'recovered'], True, True)
-    communities_interactive(modes, day_b4_max, True)
-
-    unemployment(True)
-    CPI(True)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--dataset', type=str, help='dataset spec json filename, spain if not provided')
+    parser.add_argument('-i', '--interactive-all', action='store_true',
+                        help='save interactive snapshot for every day, skipping up to date ones')
+    parser.add_argument('-p', '--preview', action='store_true',
+                        help='fast preview (lower resolution, every few days, simplified borders) to *_preview files')
+    parser.add_argument('-P', '--parallel', action='store_true',
+                        help='render maps of every mode in its own process')
+    profiling.add_arguments(parser)
+    parsed_args = parser.parse_args()
+
+    with profiling.session(parsed_args):
+        if parsed_args.dataset:
+            dataset = load_spec(parsed_args.dataset)
+            if parsed_args.preview:
+                dataset = preview_spec(dataset)
+            dataset_modes = [mode for mode in modes if mode in dataset['files']]
+            with profiling.stage('communities_cases norm'):
+                communities_cases(dataset_modes, True, False, parsed_args.parallel, spec=dataset)
+            with profiling.stage('communities_cases lognorm'):
+                communities_cases(dataset_modes, True, True, parsed_args.parallel, spec=dataset)
+            with profiling.stage('communities_interactive'):
+                communities_interactive(dataset_modes, dataset_dates(dataset)[-1], True, spec=dataset)
+            if parsed_args.interactive_all:
+                with profiling.stage('communities_interactive_all'):
+                    communities_interactive_all(dataset_modes, spec=dataset)
+        else:
+            dataset = preview_spec(spain) if parsed_args.preview else spain
+            with profiling.stage('communities_cases norm'):
+                communities_cases(['cases', 'death', 'hosp', 'recovered'], True, False, parsed_args.parallel, spec=dataset)
+            with profiling.stage('communities_cases lognorm'):
+                communities_cases(['cases', 'death', 'hosp', 'recovered'], True, True, parsed_args.parallel, spec=dataset)
+            with profiling.stage('communities_interactive'):
+                communities_interactive(modes, day_b4_max, True, spec=dataset)
+            if parsed_args.interactive_all:
+                with profiling.stage('communities_interactive_all'):
+                    communities_interactive_all(modes, spec=dataset)
+
+            with profiling.stage('unemployment'):
+                unemployment(True)
+            with profiling.stage('CPI'):
+                CPI(True)
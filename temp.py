@@ -2,16 +2,20 @@
 
 import argparse
 import csv
+import os
 import statistics
 from pathlib import Path
 from typing import List
 
+import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 import math
 
 from matplotlib.ticker import AutoMinorLocator
 
+import profiling
+
 old_headers = [
     "record_id",
     "month",
@@ -140,11 +144,14 @@ def load_and_filter(database: str) -> list:
     for record in temps:
         record.convert_temps()
 
-    with open(clean_db_path, 'w') as temp_out_file:
+    # written under temporary name, so parallel runs never read half written file
+    tmp_clean_db_path = f'{clean_db_path}.{os.getpid()}.tmp'
+    with open(tmp_clean_db_path, 'w') as temp_out_file:
         writer = csv.writer(temp_out_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_NONNUMERIC)
         writer.writerow(new_headers)
         for record in temps:
             writer.writerow(list(record.__dict__.values()))
+    os.replace(tmp_clean_db_path, clean_db_path)
 
     return temps
 
@@ -156,7 +163,7 @@ def init_countries(temps):
             countries_recs[record.country_id].append(record)
         else:
             countries_recs[record.country_id] = [record]
-    CountryData.map = plt.cm.get_cmap('hsv', len(countries_recs))
+    CountryData.map = matplotlib.colormaps['hsv'].resampled(len(countries_recs))
     return countries_recs
 
 
@@ -167,7 +174,7 @@ def init_cities(temps):
             cities_recs[record.City].append(record)
         else:
             cities_recs[record.City] = [record]
-    CityData.map = plt.cm.get_cmap('hsv', len(cities_recs))
+    CityData.map = matplotlib.colormaps['hsv'].resampled(len(cities_recs))
     return cities_recs
 
 
@@ -188,12 +195,13 @@ def get_cities_grouped(temps):
 def show_grid(ax):
     ax.xaxis.set_minor_locator(AutoMinorLocator())
     ax.yaxis.set_minor_locator(AutoMinorLocator())
-    ax.grid(b=True, which='major', linestyle='-')
-    ax.grid(b=True, which='minor', linestyle='-', alpha=0.2)
+    ax.grid(visible=True, which='major', linestyle='-')
+    ax.grid(visible=True, which='minor', linestyle='-', alpha=0.2)
 
 
 def main(args):
-    temps = load_and_filter(args.database)
+    with profiling.stage('load'):
+        temps = load_and_filter(args.database)
     font_dict = {'size': 16} if not args.bigformat else {'size': 20}
     if args.mode not in ['grid']:
         fig, ax = plt.subplots(figsize=(10, 6))
@@ -347,10 +355,11 @@ def main(args):
                      rotation='vertical', fontdict=font_dict)
         # fig.tight_layout(pad=1.0)
 
-    if args.output:
-        plt.savefig(args.output)
-    else:
-        plt.show()
+    with profiling.stage('save'):
+        if args.output:
+            plt.savefig(args.output)
+        else:
+            plt.show()
 
 
 if __name__ == '__main__':
@@ -368,6 +377,8 @@ if __name__ == '__main__':
     parser.add_argument('-b', '--bigformat', action='store_true', help='format labels and suptitle 2nd')
     parser.add_argument('-a', '--alpha', type=float, default=1, help='alpha channel for plots')
     parser.add_argument('-o', '--output', type=str, help='output filename')
+    profiling.add_arguments(parser)
     parsed_args = parser.parse_args()
 
-    main(parsed_args)
+    with profiling.session(parsed_args):
+        main(parsed_args)
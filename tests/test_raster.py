@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+pytest.importorskip('PIL')
+
+import numpy as np
+import raster
+
+# frames larger than pipe buffer, so some of them are still waiting in the queue when encoder dies
+dead_encoder = '''
+import numpy as np
+import raster
+frames = (np.full((500, 600, 4), i, np.uint8) for i in range(100))
+raster.save_frames(frames, {filename!r}, 0.1)
+'''
+
+
+def test_save_frames_writes_gif(tmp_path):
+    filename = str(tmp_path / 'frames.gif')
+    frames = [np.full((20, 30, 4), i * 50, np.uint8) for i in range(4)]
+    raster.save_frames(frames, filename, 0.1)
+
+    from PIL import Image
+    with Image.open(filename) as gif:
+        assert gif.size == (30, 20)
+        assert gif.n_frames == 4
+
+
+def test_save_frames_fails_without_hanging_when_encoder_dies(tmp_path):
+    filename = str(tmp_path / 'nonexistent' / 'frames.gif')
+    # hang would be at interpreter exit, so it runs in its own process
+    result = subprocess.run([sys.executable, '-c', dead_encoder.format(filename=filename)], cwd=root,
+                            capture_output=True, text=True, timeout=60)
+
+    assert result.returncode != 0
+    assert f'Encoding of {filename} failed' in result.stderr
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+pytest.importorskip('bokeh')
+pytest.importorskip('geopandas')
+
+import spain_covid19
+
+
+def test_interactive_batch_writes_and_skips_up_to_date_days(tmp_path, monkeypatch):
+    monkeypatch.chdir(root)
+    spec = {**spain_covid19.spain, 'output_dir': str(tmp_path)}
+    days = ['2020-04-01', '2020-05-18']
+
+    written = spain_covid19.communities_interactive_all(spain_covid19.modes, days, spec, workers=2)
+    assert written == [spain_covid19.interactive_filename(day, spec) for day in days]
+    for filename in written:
+        with open(filename) as snapshot:
+            assert 'Bokeh' in snapshot.read()
+
+    assert spain_covid19.communities_interactive_all(spain_covid19.modes, days, spec, workers=2) == []
+    # other modes change stamp, so all days are rendered again
+    assert len(spain_covid19.communities_interactive_all(spain_covid19.modes[:2], days, spec, workers=2)) == 2
@@ -0,0 +1,54 @@
+import numpy as np
+
+import cube
+
+
+# frame times (fractional years), n frames per step of time index (year, month, day)
+def tween_times(index: np.ndarray, steps: int) -> np.ndarray:
+    tweens = index[:-1, None] + np.diff(index)[:, None] * np.arange(steps) / steps
+    return np.append(tweens.ravel(), index[-1])
+
+
+# slopes of monotone cubic (pchip) interpolation, zero where values change direction, so there is no overshoot
+def pchip_slopes(values: np.ndarray, h: np.ndarray) -> np.ndarray:
+    delta = np.diff(values, axis=1) / h
+    slopes = np.empty_like(values)
+    slopes[:, 0], slopes[:, -1] = delta[:, 0], delta[:, -1]
+    w1, w2 = 2 * h[1:] + h[:-1], h[1:] + 2 * h[:-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = (w1 + w2) / (w1 / delta[:, :-1] + w2 / delta[:, 1:])
+    slopes[:, 1:-1] = np.where(delta[:, :-1] * delta[:, 1:] > 0, mean, 0)
+    return slopes
+
+
+# values (countries x years) interpolated in given times, all countries at once
+def interpolate(values: np.ndarray, years: np.ndarray, times: np.ndarray, method='linear') -> np.ndarray:
+    values = np.asarray(values, dtype=float)
+    h = np.diff(years).astype(float)
+    k = np.clip(np.searchsorted(years, times, side='right') - 1, 0, len(years) - 2)
+    t = (times - years[k]) / h[k]
+    if method == 'linear':
+        return values[:, k] + (values[:, k + 1] - values[:, k]) * t
+    elif method == 'cubic':
+        slopes = pchip_slopes(values, h)
+        t2, t3 = t * t, t * t * t
+        return ((2 * t3 - 3 * t2 + 1) * values[:, k] + (t3 - 2 * t2 + t) * h[k] * slopes[:, k] +
+                (-2 * t3 + 3 * t2) * values[:, k + 1] + (t3 - t2) * h[k] * slopes[:, k + 1])
+    else:
+        raise Exception('Wrong interpolation')
+
+
+# indicator of countries interpolated in frame times from its own time axis, nan out of it
+def indicator_frames(indicators: cube.Cube, indicator: str, countries: list, times: np.ndarray,
+                     method='linear') -> np.ndarray:
+    own = indicators.times[indicator]
+    values = interpolate(indicators.matrix(indicator, countries), own, times, method)
+    return np.where((times >= own[0]) & (times <= own[-1]), values, np.nan)
+
+
+# bar position of every country by its rank in each year (largest at 0), interpolated so bars slide when ranks change
+def rank_positions(values: np.ndarray, years: np.ndarray, times: np.ndarray) -> np.ndarray:
+    order = np.argsort(-np.asarray(values, dtype=float), axis=0, kind='stable')
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(len(values))[:, None], axis=0)
+    return interpolate(ranks, years, times)